@@ -1,110 +1,104 @@
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-import os
-
-def analyze_results(dir_path: str, config: dict, seed: int):
-    print("Loading results...", end=" ")
-
-    df = pd.read_csv(os.path.join(dir_path, "result.csv"))
-
-    print("loaded", end="\n\t")
-
-    # Column names:
-    # ["User ID", "Start Time", "From Station", "To Station", "Vehicle ID", "Unlock Time", "Lock Time", "Total Time", "Battery Used", "Distance", "Velocity"]
-            
-    print("Calculating statistics...", end=" ")
+import numpy as np
+import os, sys, csv, json
+
+from simulation.results import load_records, iter_records
+from metrics import STATISTICS, COLUMN_METRICS, COUNT_METRICS, TripAccumulator, trip_statistics
+from plots import compute_histograms, histograms_from_file, save_histograms, render_plots, check_names
+
+# The analysis only needs NumPy: the trips are a structured array (a DataFrame is accepted too)
+# and the table of the stations is a dict of columns, pandas and matplotlib are imported only when needed
+# (reading result.csv in blocks, rendering the plots)
+
+def read_table(path: str) -> dict:
+    # Columns of a CSV file written by write_table, integer columns as int64 arrays and the others as float64
+    with open(path, "r", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        columns = list(zip(*reader)) or [()] * len(header)
+    table = {}
+    for name, values in zip(header, columns):
+        try:
+            table[name] = np.array([int(v) for v in values], dtype=np.int64)
+        except ValueError:
+            table[name] = np.array([float(v) for v in values], dtype=np.float64)
+    return table
+
+def write_table(path: str, table: dict):
+    # Columns (lists of the same length) to a CSV file with a header, like DataFrame.to_csv(index=False)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(table.keys())
+        writer.writerows(zip(*table.values()))
+
+def station_table(stations: list) -> dict:
+    # Counters of the stations (columns of stations.csv)
+    table = {
+        "Station ID": [s.id for s in stations],
+        "Preemptions": [s.preemptions for s in stations],
+        "Preemptions Avoided": [s.preemptions_avoided for s in stations],
+    }
+
+    # about the queues of the users waiting for a vehicle (unlock) or a slot (lock)
+    queues = [s.queue_statistics() for s in stations]
+    for name in ["unlock", "lock"]:
+        if not all(name in q for q in queues):
+            continue
+        prefix = name.capitalize()
+        table[prefix + " Requests"] = [q[name]["requests"] for q in queues]
+        table[prefix + " Waits"] = [q[name]["waits"] for q in queues]
+        table[prefix + " Average Queue"] = [q[name]["avg_queue"] for q in queues]
+        table[prefix + " Max Queue"] = [q[name]["max_queue"] for q in queues]
+        table[prefix + " Total Wait"] = [q[name]["total_wait"] for q in queues]
+        table[prefix + " Busy Fraction"] = [q[name]["busy_fraction"] for q in queues]
+
+    return table
+
+def analyze(config: dict, seed: int, df: np.ndarray = None, accumulator: TripAccumulator = None, stations_table: dict = None, stop_reason: str = None, end_time: float = None) -> dict:
+    # Statistics of the trips (df, or accumulator if given) and of the counters of the stations (see station_table),
+    # computed in memory without reading or writing files
+    # Returns {"statistics": statistics of each metric (see metrics), "summary": main statistics, "report": text of statistics.txt}
+    analysis = config.get("analysis", {})
 
     # calculate statistics
     number_of_users = sum([int(arr[2]) for arr in config["users"]["linear"]]) + sum([int(arr[2]) for arr in config["users"]["normal"]])
-    number_of_completed_trips = len(df)
+    number_of_completed_trips = len(df) if accumulator is None else accumulator.count
 
-    # non completed trips id
-    if number_of_users != number_of_completed_trips and config["no_degeneration"]:
-        non_completed_trips = set(range(number_of_users)) - set(df["User ID"])
+    # non completed trips id (a simulation stopped early leaves trips in progress)
+    if number_of_users != number_of_completed_trips and config["no_degeneration"] and stop_reason in (None, "empty"):
+        non_completed_trips = set(range(number_of_users)) - (set() if df is None else set(df["User ID"]))
         assert len(non_completed_trips) == 0, "Non completed trips: {}".format(non_completed_trips)
 
-    # about distance
-    avg_distance = df["Distance"].mean()
-    max_distance = df["Distance"].max()
-    min_distance = df["Distance"].min()
-    median_distance = df["Distance"].median()
-    mode_distance = df["Distance"].mode()[0]
-    variance_distance = df["Distance"].var()
-
-    # about velocity
-    avg_velocity = df["Velocity"].mean()
-    max_velocity = df["Velocity"].max()
-    min_velocity = df["Velocity"].min()
-    median_velocity = df["Velocity"].median()
-    mode_velocity = df["Velocity"].mode()[0]
-    variance_velocity = df["Velocity"].var()
-
-    # about lock time
-    avg_lock_time = df["Lock Time"].mean()
-    max_lock_time = df["Lock Time"].max()
-    min_lock_time = df["Lock Time"].min()
-    median_lock_time = df["Lock Time"].median()
-    mode_lock_time = df["Lock Time"].mode()[0]
-    variance_lock_time = df["Lock Time"].var()
-
-    # about unlock time
-    avg_unlock_time = df["Unlock Time"].mean()
-    max_unlock_time = df["Unlock Time"].max()
-    min_unlock_time = df["Unlock Time"].min()
-    median_unlock_time = df["Unlock Time"].median()
-    mode_unlock_time = df["Unlock Time"].mode()[0]
-    variance_unlock_time = df["Unlock Time"].var()
-
-    # about trip time (total time - lock time - unlock time)
-    avg_trip_time = (df["Total Time"] - df["Lock Time"] - df["Unlock Time"]).mean()
-    max_trip_time = (df["Total Time"] - df["Lock Time"] - df["Unlock Time"]).max()
-    min_trip_time = (df["Total Time"] - df["Lock Time"] - df["Unlock Time"]).min()
-    median_trip_time = (df["Total Time"] - df["Lock Time"] - df["Unlock Time"]).median()
-    mode_trip_time = (df["Total Time"] - df["Lock Time"] - df["Unlock Time"]).mode()[0]
-    variance_trip_time = (df["Total Time"] - df["Lock Time"] - df["Unlock Time"]).var()
-
-    # about total time
-    avg_total_time = df["Total Time"].mean()
-    max_total_time = df["Total Time"].max()
-    min_total_time = df["Total Time"].min()
-    median_total_time = df["Total Time"].median()
-    mode_total_time = df["Total Time"].mode()[0]
-    variance_total_time = df["Total Time"].var()
-
-    # about departures per station
-    group = df.groupby("From Station").count()["User ID"]
-    avg_departures_per_station = group.mean()
-    max_departures_per_station = group.max()
-    min_departures_per_station = group.min()
-    median_departures_per_station = group.median()
-    mode_departures_per_station = group.mode()[0]
-    variance_departures_per_station = group.var()
-    
-    # about arrivals per station
-    group = df.groupby("To Station").count()["User ID"]
-    avg_arrivals_per_station = group.mean()
-    max_arrivals_per_station = group.max()
-    min_arrivals_per_station = group.min()
-    median_arrivals_per_station = group.median()
-    mode_arrivals_per_station = group.mode()[0]
-    variance_arrivals_per_station = group.var()
-
-    # about use of vehicles
-    group = df.groupby("Vehicle ID").count()["User ID"]
-    avg_trips_per_vehicle = group.mean()
-    max_trips_per_vehicle = group.max()
-    min_trips_per_vehicle = group.min()
-    median_trips_per_vehicle = group.median()
-    mode_trips_per_vehicle = group.mode()[0]
-    variance_trips_per_vehicle = group.var()
-
-    # save this statistics in a file
-    with open(os.path.join(dir_path, "statistics.txt"), "w") as f:
-        print(
+    # all the statistics in one pass over each column (see metrics)
+    if accumulator is not None:
+        statistics = accumulator.statistics()
+    else:
+        statistics = trip_statistics(df, analysis.get("mode_bins"))
+
+    if stations_table is not None:
+        stations_table = {name: np.asarray(values) for name, values in stations_table.items()}
+        total_preemptions = stations_table["Preemptions"].sum()
+        total_preemptions_avoided = stations_table["Preemptions Avoided"].sum()
+        max_preemptions_avoided = stations_table["Preemptions Avoided"].max()
+
+        queue_statistics = []
+        for prefix in ["Unlock", "Lock"]:
+            if prefix + " Max Queue" in stations_table:
+                total_wait = stations_table[prefix + " Total Wait"].sum()
+                hottest = stations_table["Station ID"][stations_table[prefix + " Total Wait"].argmax()] if total_wait > 0 else None
+                queue_statistics += [total_wait, stations_table[prefix + " Max Queue"].max(), hottest]
+            else:
+                queue_statistics += [None, None, None]
+    else:
+        total_preemptions = total_preemptions_avoided = max_preemptions_avoided = None
+        queue_statistics = [None] * 6
+
+    # text of statistics.txt
+    report = (
 """Seed: {}
 Number of users: {}
 Number of completed trips: {}
+Stop reason: {}
+End time: {}
 
 Average distance: {}
 Maximum distance: {}
@@ -168,83 +162,149 @@ Minimum trips per vehicle: {}
 Median trips per vehicle: {}
 Mode trips per vehicle: {}
 Variance trips per vehicle: {}
+
+Charging preemptions: {}
+Charging preemptions avoided: {}
+Maximum charging preemptions avoided per station: {}
+
+Total unlock wait time: {}
+Maximum unlock queue: {}
+Station with the longest unlock wait: {}
+Total lock wait time: {}
+Maximum lock queue: {}
+Station with the longest lock wait: {}
 """.format(
     seed,
     number_of_users, number_of_completed_trips,
-    avg_distance, max_distance, min_distance, median_distance, mode_distance, variance_distance,
-    avg_velocity, max_velocity, min_velocity, median_velocity, mode_velocity, variance_velocity,
-    avg_lock_time, max_lock_time, min_lock_time, median_lock_time, mode_lock_time, variance_lock_time,
-    avg_unlock_time, max_unlock_time, min_unlock_time, median_unlock_time, mode_unlock_time, variance_unlock_time,
-    avg_trip_time, max_trip_time, min_trip_time, median_trip_time, mode_trip_time, variance_trip_time,
-    avg_total_time, max_total_time, min_total_time, median_total_time, mode_total_time, variance_total_time,
-    avg_departures_per_station, max_departures_per_station, min_departures_per_station, median_departures_per_station, mode_departures_per_station, variance_departures_per_station,
-    avg_arrivals_per_station, max_arrivals_per_station, min_arrivals_per_station, median_arrivals_per_station, mode_arrivals_per_station, variance_arrivals_per_station,
-    avg_trips_per_vehicle, max_trips_per_vehicle, min_trips_per_vehicle, median_trips_per_vehicle, mode_trips_per_vehicle, variance_trips_per_vehicle
-), file=f)
+    stop_reason, end_time,
+    *[statistics[name][statistic] for name in list(COLUMN_METRICS) + list(COUNT_METRICS) for statistic in STATISTICS],
+    total_preemptions, total_preemptions_avoided, max_preemptions_avoided,
+    *queue_statistics
+))
     
+    # main statistics, returned to the caller (e.g. the sweep runner)
+    summary = {
+        "seed": seed,
+        "users": number_of_users,
+        "completed_trips": number_of_completed_trips,
+        "stop_reason": stop_reason,
+        "end_time": end_time,
+        "avg_unlock_time": float(statistics["unlock_time"]["mean"]),
+        "avg_lock_time": float(statistics["lock_time"]["mean"]),
+        "avg_trip_time": float(statistics["trip_time"]["mean"]),
+        "avg_total_time": float(statistics["total_time"]["mean"]),
+        "max_total_time": float(statistics["total_time"]["max"]),
+        "preemptions": None if total_preemptions is None else int(total_preemptions),
+    }
+
+    return {"statistics": statistics, "summary": summary, "report": report}
+
+def analyze_results(dir_path: str, config: dict, seed: int, stations: list = None, df: np.ndarray = None, stop_reason: str = None, end_time: float = None, accumulator: TripAccumulator = None, plots: list = None) -> dict:
+    # df: trips collected by the simulation (structured array or DataFrame), if None they are read from the result file in dir_path
+    # stop_reason, end_time: why and when the simulation stopped (see Termination.run)
+    # accumulator: statistics computed online during the simulation, used instead of the trip table
+    # With "out_of_core" in the analysis configuration the result file is read in blocks of compact records
+    # and the statistics are accumulated, without loading the whole trip table
+    # plots: names of the plots to render (all if None, none if empty), their histograms are saved with them (see plots)
+    # Returns a summary with the main statistics
+    analysis = config.get("analysis", {})
+
+    print("Loading results...", end=" ")
+
+    if df is None and accumulator is None:
+        if analysis.get("out_of_core", False):
+            accumulator = TripAccumulator(analysis.get("bin_width", 0.01), analysis.get("sketch_k", 200))
+            for records in iter_records(dir_path, analysis.get("chunk_size", 65536)):
+                accumulator.update(records)
+        else:
+            df = load_records(dir_path)
+
+    print("loaded", end="\n\t")
+
+    # Column names:
+    # ["User ID", "Start Time", "From Station", "To Station", "Vehicle ID", "Unlock Time", "Lock Time", "Total Time", "Battery Used", "Distance", "Velocity"]
+            
+    print("Calculating statistics...", end=" ")
+
+    # about charging (counters of the stations), read from stations.csv when analyzing a previous simulation
+    if stations is None and os.path.exists(os.path.join(dir_path, "stations.csv")):
+        stations_table = read_table(os.path.join(dir_path, "stations.csv"))
+    elif stations is not None:
+        stations_table = station_table(stations)
+        write_table(os.path.join(dir_path, "stations.csv"), stations_table)
+    else:
+        stations_table = None
+
+    analyzed = analyze(config, seed, df, accumulator, stations_table, stop_reason, end_time)
+
+    # save this statistics in a file
+    with open(os.path.join(dir_path, "statistics.txt"), "w") as f:
+        print(analyzed["report"], file=f)
+
+    summary = analyzed["summary"]
+
     # print("calculated")
     # return
 
     print("calculated", end="\n\t")
 
     print("Plotting results...", end=" ")
-    
-    # create a directory for the plots
-    os.makedirs(os.path.join(dir_path, "plots"))
-    
-    # plot a fig with time on the x from 0 to config["run_time"] and on the y the number of users
-    plt.figure()
-    sns.histplot(data=df, x="Start Time", bins=100)
-    plt.savefig(os.path.join(dir_path, "plots/start_time.png"))
-
-    # plot unlock time
-    plt.figure()
-    sns.histplot(data=df, x="Unlock Time", bins=100)
-    plt.savefig(os.path.join(dir_path, "plots/unlock_time.png"))
-
-    # plot lock time
-    plt.figure()
-    sns.histplot(data=df, x="Lock Time", bins=100)
-    plt.savefig(os.path.join(dir_path, "plots/lock_time.png"))
-
-    # plot From Station
-    plt.figure()
-    sns.histplot(data=df, x="From Station", bins=100)
-    plt.savefig(os.path.join(dir_path, "plots/from_station.png"))
-
-    # plot To Station
-    plt.figure()
-    sns.histplot(data=df, x="To Station", bins=100)
-    plt.savefig(os.path.join(dir_path, "plots/to_station.png"))
-
-    # Plot vehicle used
-    plt.figure()
-    sns.histplot(data=df, x="Vehicle ID", bins=100)
-    plt.savefig(os.path.join(dir_path, "plots/vehicle_used.png"))
-
-    # plot distance
-    plt.figure()
-    sns.histplot(data=df, x="Distance", bins=100)
-    plt.savefig(os.path.join(dir_path, "plots/distance.png"))
-
-    # plot battery used
-    plt.figure()
-    sns.histplot(data=df, x="Battery Used", bins=100)
-    plt.savefig(os.path.join(dir_path, "plots/battery_used.png"))
-
-    # plot total time
-    plt.figure()
-    sns.histplot(data=df, x="Total Time", bins=100)
-    plt.savefig(os.path.join(dir_path, "plots/total_time.png"))
-
-    # plot velocity
-    plt.figure()
-    sns.histplot(data=df, x="Velocity", bins=100)
-    plt.savefig(os.path.join(dir_path, "plots/velocity.png"))
-
-    # plot trip time
-    plt.figure()
-    sns.histplot(data=df, x=df["Total Time"] - df["Lock Time"] - df["Unlock Time"], bins=100)
-    plt.savefig(os.path.join(dir_path, "plots/trip_time.png"))
-
-    print("plotted")
\ No newline at end of file
+
+    # without plots the histograms aren't computed, plots.py computes them from the result file if needed later
+    if plots is not None and not plots:
+        print("skipped")
+        return summary
+
+    # histograms of the plots, saved so the plots can be rendered again without the trip table
+    if df is not None:
+        histograms = compute_histograms(df)
+    else:
+        histograms = histograms_from_file(dir_path, analysis.get("chunk_size", 65536))
+    save_histograms(dir_path, histograms)
+
+    render_plots(dir_path, histograms, plots, analysis.get("plot_workers"))
+    print("plotted")
+
+    return summary
+
+def main():
+    # Analyze again the results of a simulation, e.g. with the out of core analysis for a large result file
+    if len(sys.argv) < 2 or sys.argv[1] in ("-h", "--help"):
+        print("Usage: python3 {} SIMULATION_PATH [--out-of-core] [--chunk-size=N] [--no-plots|--plots=NAME,...]".format(sys.argv[0]))
+        print("\tSIMULATION_PATH		Directory of a simulation (with result.csv or result.npy and conf/simulation.json)")
+        print("\t--out-of-core		Read the result file in blocks, memory doesn't depend on the number of trips")
+        print("\t--chunk-size=N		Trips of each block")
+        print("\t--no-plots		Only the statistics (no plots nor histograms)")
+        print("\t--plots=NAME,...	Render only the given plots (see plots.PLOTS)")
+        exit()
+
+    dir_path = sys.argv[1]
+    with open(os.path.join(dir_path, "conf/simulation.json"), "r") as f:
+        config = json.load(f)
+
+    analysis = config.setdefault("analysis", {})
+    plots = None
+    for arg in sys.argv[2:]:
+        if arg == "--out-of-core":
+            analysis["out_of_core"] = True
+        elif arg.startswith("--chunk-size="):
+            analysis["chunk_size"] = int(arg.split("=")[1])
+        elif arg == "--no-plots":
+            plots = []
+        elif arg.startswith("--plots="):
+            plots = check_names(arg.split("=")[1].split(","))
+
+    # seed, stop reason and end time aren't in the configuration, they are read from the previous statistics
+    previous = {}
+    if os.path.exists(os.path.join(dir_path, "statistics.txt")):
+        with open(os.path.join(dir_path, "statistics.txt"), "r") as f:
+            previous = dict(line.rstrip("\n").split(": ", 1) for line in f if ": " in line)
+
+    seed = previous.get("Seed", "None")
+    end_time = previous.get("End time", "None")
+    summary = analyze_results(dir_path, config, None if seed == "None" else int(seed), stop_reason=previous.get("Stop reason"),
+                              end_time=None if end_time == "None" else float(end_time), plots=plots)
+    print(json.dumps(summary, indent=4))
+
+if __name__ == "__main__":
+    main()
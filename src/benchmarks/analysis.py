@@ -0,0 +1,83 @@
+# Memory and time benchmark of the statistics of a large result file
+# Compares the exact statistics on the whole trip table with the out of core analysis (blocks of compact records)
+#
+# usage (from the src directory):
+#   python3 -m benchmarks.analysis [--trips=N] [--chunk-size=N] [--format=csv|npy]
+
+from simulation.results import ResultCollector, load_records, iter_records
+from metrics import TripAccumulator, trip_statistics
+
+import numpy as np
+import sys, time, tempfile, tracemalloc
+
+def synthetic_trips(dir_path: str, n: int, result_format: str):
+    # n trips with the distributions of a default simulation, written like a simulation does
+    rng = np.random.default_rng(0)
+    results = ResultCollector(dir_path, {"format": result_format, "flush": True, "keep": False})
+    block = 65536
+    for start in range(0, n, block):
+        m = min(block, n - start)
+        unlock = np.where(rng.random(m) < 0.1, rng.exponential(3, m), 0)
+        trip = rng.normal(12.4, 2.5, m).clip(1)
+        records = np.empty(m, dtype=results.chunk.dtype)
+        records["User ID"] = np.arange(start, start + m)
+        records["Start Time"] = np.sort(rng.uniform(0, 1440, m))
+        records["From Station"] = rng.integers(0, 361, m)
+        records["To Station"] = rng.integers(0, 361, m)
+        records["Vehicle ID"] = rng.integers(0, 5000, m)
+        records["Unlock Time"] = unlock
+        records["Lock Time"] = 0
+        records["Total Time"] = unlock + trip
+        records["Battery Used"] = rng.uniform(10, 30, m)
+        records["Distance"] = rng.normal(3000, 100, m)
+        records["Velocity"] = rng.normal(250, 45, m)
+        results.write(records)
+    results.close()
+
+def measure(function):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+def exact(dir_path: str):
+    return trip_statistics(load_records(dir_path))
+
+def out_of_core(dir_path: str, chunk_size: int):
+    accumulator = TripAccumulator()
+    for records in iter_records(dir_path, chunk_size):
+        accumulator.update(records)
+    return accumulator.statistics()
+
+def main():
+    trips = 2000000
+    chunk_size = 65536
+    result_format = "csv"
+
+    for arg in sys.argv[1:]:
+        if arg.startswith("--trips="):
+            trips = int(arg.split("=")[1])
+        elif arg.startswith("--chunk-size="):
+            chunk_size = int(arg.split("=")[1])
+        elif arg.startswith("--format="):
+            result_format = arg.split("=")[1]
+
+    with tempfile.TemporaryDirectory() as dir_path:
+        synthetic_trips(dir_path, trips, result_format)
+        print("{} trips ({})".format(trips, result_format))
+
+        statistics = {}
+        for name, function in [("exact", lambda: exact(dir_path)), ("out of core", lambda: out_of_core(dir_path, chunk_size))]:
+            statistics[name], elapsed, peak = measure(function)
+            print("{:>16}: {:>7.2f}s, peak {:>8.1f} MB".format(name, elapsed, peak / 1e6))
+
+        for metric in ["unlock_time", "total_time", "distance"]:
+            print("{:>16}: median {:.4f} (exact {:.4f}), mean {:.6f} (exact {:.6f})".format(
+                metric, statistics["out of core"][metric]["median"], statistics["exact"][metric]["median"],
+                statistics["out of core"][metric]["mean"], statistics["exact"][metric]["mean"]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+# Events/sec benchmark for the Environment event queue
+# Compares the schedulers of the Environment against the previous sortedlist based event queue,
+# and the generator processes against the callback events (Environment.call_at) with the same trips
+# Each measure is the median of --repeat runs, callbacks and processes are compared by the median of the ratios
+# of alternated pairs of runs: their difference is within the noise of a single run (about 0.95x, the callbacks
+# mainly simplify the process model and reduce the memory of the pending users, see benchmarks.memory)
+#
+# usage (from the src directory):
+#   python3 -m benchmarks.event_queue [--processes=N] [--events=N] [--seed=SEED] [--bucket-width=WIDTH] [--repeat=N]
+
+from environment.env import Environment
+from environment.process import Process
+from environment.scheduler import HeapQueue, CalendarQueue
+from environment.constants import *
+
+import random, statistics, sys, time
+
+class sortedlist(list):
+    # List of processes kept sorted by time (the previous event queue of the Environment)
+
+    def insert(self, element):
+        # binary search to find the right position
+        lo = 0
+        hi = len(self)
+        while lo < hi:
+            mid = (lo+hi)//2
+            if self[mid].time < element.time: lo = mid+1
+            else: hi = mid
+        super().insert(lo, element)
+
+class SortedListEnvironment(Environment):
+    # Environment scheduling processes with the previous sortedlist implementation
+    # (insert with binary search + list shifting, pop(0) for the next process)
+
+    def __init__(self):
+        super().__init__()
+        self.processes = sortedlist()
+
+    def add_process(self, process: Process):
+        self.processes.insert(process)
+
+    def run(self, until=None):
+        while self.processes and (until is None or self.time < until):
+            process = self.processes.pop(0)
+            self.time = process.time
+            
+            signal = process.next()
+
+            if signal == END or signal == WAIT:
+                continue
+            elif signal == GETTED:
+                self.processes.insert(process)
+            elif signal[1] == TIMEOUT:
+                process.time = self.time + signal[0]
+                self.processes.insert(process)
+
+    def awake(self, process: Process):
+        process.time = self.time
+        self.processes.insert(process)
+
+def trip(durations: list):
+    # a process that waits for each duration in turn, like a user moving between stations
+    for d in durations:
+        yield timeout(d)
+
+def callback_trip(env: Environment, durations: list, i: int = 0):
+    # the same trip as a chain of callback events
+    if i < len(durations):
+        env.call_in(durations[i], callback_trip, env, durations, i + 1)
+
+def workload(processes: int, events: int, seed: int):
+    # start times spread over a day, each process yields events/processes timeouts of a few minutes
+    rng = random.Random(seed)
+    per_process = max(1, events // processes)
+    return [(rng.uniform(0, 1440), [rng.uniform(1, 30) for _ in range(per_process)]) for _ in range(processes)]
+
+def bench(make_env, work: list):
+    env = make_env()
+    for start, durations in work:
+        env.add_process(Process(start, trip(durations)))
+
+    events = sum(len(durations) + 1 for _, durations in work)
+
+    start = time.perf_counter()
+    env.run()
+    elapsed = time.perf_counter() - start
+
+    return events, elapsed
+
+def bench_callbacks(make_env, work: list):
+    env = make_env()
+    for start, durations in work:
+        env.call_at(start, callback_trip, env, durations)
+
+    events = sum(len(durations) + 1 for _, durations in work)
+
+    start = time.perf_counter()
+    env.run()
+    elapsed = time.perf_counter() - start
+
+    return events, elapsed
+
+def median_rate(bench, make_env, work: list, repeat: int) -> tuple:
+    # Median events/sec of repeat runs, and the number of events of a run
+    runs = [bench(make_env, work) for _ in range(repeat)]
+    return statistics.median(n / elapsed for n, elapsed in runs), runs[0][0]
+
+def main():
+    processes = 10000
+    events = 100000
+    seed = 0
+    bucket_width = 1.0
+    repeat = 5
+
+    for arg in sys.argv[1:]:
+        if arg.startswith("--processes="):
+            processes = int(arg.split("=")[1])
+        elif arg.startswith("--events="):
+            events = int(arg.split("=")[1])
+        elif arg.startswith("--seed="):
+            seed = int(arg.split("=")[1])
+        elif arg.startswith("--bucket-width="):
+            bucket_width = float(arg.split("=")[1])
+        elif arg.startswith("--repeat="):
+            repeat = int(arg.split("=")[1])
+
+    work = workload(processes, events, seed)
+
+    print("{} processes, {} events per process, median of {} runs".format(processes, len(work[0][1]) + 1, repeat))
+    results = {}
+    environments = [
+        ("sortedlist", SortedListEnvironment),
+        ("heap", lambda: Environment(HeapQueue())),
+        ("calendar", lambda: Environment(CalendarQueue({"bucket_width": bucket_width}))),
+    ]
+    for name, make_env in environments:
+        results[name], n = median_rate(bench, make_env, work, repeat)
+        print("{:>16}: {:>10.0f} events/sec ({} events)".format(name, results[name], n))
+
+    for name in ["heap", "calendar"]:
+        print("{:>16}: {:.2f}x".format(name + " speedup", results[name] / results["sortedlist"]))
+
+    # processes and callbacks alternated, so that the ratio of each pair of runs isn't biased by the load of the machine
+    ratios = []
+    for _ in range(repeat):
+        n, processes_elapsed = bench(lambda: Environment(HeapQueue()), work)
+        n, callbacks_elapsed = bench_callbacks(lambda: Environment(HeapQueue()), work)
+        ratios.append(processes_elapsed / callbacks_elapsed)
+    print("{:>16}: {:.2f}x (median of {} pairs, from {:.2f}x to {:.2f}x)".format("callback ratio", statistics.median(ratios), repeat, min(ratios), max(ratios)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# Memory benchmark of the vehicles and users
+# Bytes per vehicle and per user (with its process) measured with tracemalloc,
+# for the previous dict based classes, the __slots__ classes and the Fleet backend (vehicles)
+# and the users with their start event instead of the previous generator process
+#
+# usage (from the src directory):
+#   python3 -m benchmarks.memory [--vehicles=N] [--users=N]
+
+from environment.constants import timeout
+from environment.event import Event
+from simulation.vehicle import Scooter
+from simulation.fleet import Fleet
+from simulation.user import User
+
+import random, sys, tracemalloc
+
+class DictScooter:
+    # Vehicle with the previous dict based attributes (and properties reading the class attributes)
+    BATTERY_CAPACITY = 1000
+    ENERGY_CONSUMPTION = 0.0666
+
+    def __init__(self, vehicle_id):
+        self.id = vehicle_id
+        self.battery = 1
+        self.charge_start_time = None
+        self.charge_rate = 0
+
+    @property
+    def max_capacity(self):
+        return self.BATTERY_CAPACITY
+
+class DictProcess:
+    # Process with the previous dict based attributes
+    def __init__(self, time, generator):
+        self.time = time
+        self.generator = generator
+        self.cancelled = False
+
+class DictUser:
+    # User with the previous dict based attributes and generator process
+    def __init__(self, id, from_station, to_station, velocity):
+        self.id = id
+        self.from_station = from_station
+        self.to_station = to_station
+        self.velocity = velocity
+        self.process = None
+
+    def run(self):
+        # previous generator of the users (same locals and frame size), without the trace points
+        start_time = self.env.now()
+        request_time = self.env.now()
+        yield self.from_station.request_unlock(self.process)
+        vehicle = self.from_station.unlock()
+        unlock_time = self.env.now() - request_time
+        battery = vehicle.battery*100
+        distance = self.from_station.distance(self.to_station)
+        vehicle.move(distance)
+        time = distance / self.velocity
+        yield timeout(time)
+        battery_used = battery - vehicle.battery*100
+        request_time = self.env.now()
+        yield self.to_station.request_lock(self.process)
+        self.to_station.lock(vehicle)
+        lock_time = self.env.now() - request_time
+        total_time = self.env.now() - start_time
+        self.results.append(self.id, start_time, self.from_station.id, self.to_station.id, vehicle.id, unlock_time, lock_time, total_time, battery_used, distance, self.velocity)
+
+def measure(build, n: int) -> float:
+    # Bytes allocated per object by build(n), the objects are kept alive while measuring
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = build(n)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objects
+    return (after - before) / n
+
+def vehicles(cls):
+    def build(n):
+        vehicles = [cls(i) for i in range(n)]
+        # after a trip each vehicle has its own battery level
+        for v in vehicles:
+            v.battery = 1 - random.random() / 2
+        return vehicles
+    return build
+
+def fleet_vehicles(n):
+    fleet = Fleet()
+    return fleet, vehicles(fleet.vehicle_class(Scooter))(n)
+
+def process_users(n):
+    users = []
+    for i in range(n):
+        user = DictUser(i, None, None, random.random())
+        user.process = DictProcess(random.random(), user.run())
+        users.append(user)
+    return users
+
+def event_users(n):
+    # the start event holds the bound method, so it keeps the user alive
+    return [Event(random.random(), User(i, None, None, random.random()).start) for i in range(n)]
+
+def main():
+    n_vehicles = 100000
+    n_users = 100000
+
+    for arg in sys.argv[1:]:
+        if arg.startswith("--vehicles="):
+            n_vehicles = int(arg.split("=")[1])
+        elif arg.startswith("--users="):
+            n_users = int(arg.split("=")[1])
+
+    Scooter.configure({"Scooter": {"BATTERY_CAPACITY": 1000, "ENERGY_CONSUMPTION": 0.0666}})
+
+    print("{} vehicles".format(n_vehicles))
+    results = {}
+    for name, build in [("dict", vehicles(DictScooter)), ("slots", vehicles(Scooter)), ("fleet", fleet_vehicles)]:
+        results[name] = measure(build, n_vehicles)
+        print("{:>16}: {:>7.1f} bytes per vehicle".format(name, results[name]))
+    for name in ["slots", "fleet"]:
+        print("{:>16}: {:.2f}x".format(name + " reduction", results["dict"] / results[name]))
+
+    print("{} users (with their process or start event)".format(n_users))
+    results = {}
+    for name, build in [("process", process_users), ("event", event_users)]:
+        results[name] = measure(build, n_users)
+        print("{:>16}: {:>7.1f} bytes per user".format(name, results[name]))
+    print("{:>16}: {:.2f}x".format("event reduction", results["process"] / results["event"]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# Startup benchmark of the simulator, with python -X importtime
+# Import time of the modules needed by a run without analysis (main), by a run with only the statistics
+# (main, analisys, plots) and by a run with the plots (also matplotlib, seaborn and pandas).
+# It fails (exit status 1) if a run with only the statistics imports one of the HEAVY modules,
+# or if its import time is over --max-ms milliseconds.
+#
+# usage (from the src directory):
+#   python3 -m benchmarks.startup [--repeat=N] [--max-ms=MS]
+
+import os, sys, subprocess
+
+# modules imported by a run only to render the plots or to read result.csv in blocks
+HEAVY = ["pandas", "matplotlib", "seaborn"]
+
+RUNS = [
+    ("no analysis", "import main"),
+    ("stats only", "import main, analisys, plots"),
+    ("plots", "import main, analisys, plots, matplotlib.pyplot, seaborn, pandas"),
+]
+
+def import_times(code: str) -> tuple:
+    # Cumulative import time in microseconds of each top level import of code, in a new interpreter,
+    # and the names of all the imported modules
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True,
+                             cwd=os.path.join(os.path.dirname(__file__), ".."), check=True)
+    times = {}
+    modules = []
+    for line in process.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package (nested imports are indented)
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        modules.append(name.strip())
+        if not name.startswith("  "):
+            times[name.strip()] = int(cumulative)
+    return times, modules
+
+def main():
+    repeat = 5
+    max_ms = None
+
+    for arg in sys.argv[1:]:
+        if arg.startswith("--repeat="):
+            repeat = int(arg.split("=")[1])
+        elif arg.startswith("--max-ms="):
+            max_ms = float(arg.split("=")[1])
+
+    # the first run also compiles the modules
+    import_times(RUNS[-1][1])
+
+    failed = False
+    for name, code in RUNS:
+        # the fastest of the runs, the others are slowed down by the machine
+        times, modules = min((import_times(code) for _ in range(repeat)), key=lambda t: sum(t[0].values()))
+        total = sum(times.values()) / 1000
+        largest = sorted(times.items(), key=lambda t: -t[1])[:4]
+        print("{:>12}: {:>7.1f} ms  ({})".format(name, total, ", ".join("{} {:.1f}".format(m, t / 1000) for m, t in largest)))
+
+        if name == "stats only":
+            heavy = sorted({m.split(".")[0] for m in modules if m.split(".")[0] in HEAVY})
+            if heavy:
+                print("FAIL: a run with only the statistics imports {}".format(", ".join(heavy)))
+                failed = True
+            if max_ms is not None and total > max_ms:
+                print("FAIL: a run with only the statistics imports in {:.1f} ms (max {:.1f} ms)".format(total, max_ms))
+                failed = True
+
+    if failed:
+        exit(1)
+
+if __name__ == "__main__":
+    main()
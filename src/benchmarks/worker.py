@@ -0,0 +1,51 @@
+# Per-run overhead of the resident worker
+# Runs of the simplified configuration with few users, each one in a new worker process (startup, imports,
+# vehicle configuration and station layout every time, like a process spawned for each run) and all of them
+# in one resident worker (see worker.py)
+#
+# usage (from the src directory):
+#   python3 -m benchmarks.worker [--runs=N] [--users=N]
+
+import os, sys, json, time, subprocess
+
+def request(simplified: dict, users: int, seed: int) -> str:
+    simplified = dict(simplified, users=dict(simplified["users"], number=users))
+    return json.dumps({"id": seed, "simplified": simplified, "seed": seed}) + "\n"
+
+def run_worker(requests: list) -> list:
+    src = os.path.join(os.path.dirname(__file__), "..")
+    process = subprocess.run([sys.executable, "worker.py"], input="".join(requests), capture_output=True, text=True, cwd=src, check=True)
+    return [json.loads(line) for line in process.stdout.splitlines()]
+
+def main():
+    runs = 10
+    users = 500
+
+    for arg in sys.argv[1:]:
+        if arg.startswith("--runs="):
+            runs = int(arg.split("=")[1])
+        elif arg.startswith("--users="):
+            users = int(arg.split("=")[1])
+
+    with open(os.path.join(os.path.dirname(__file__), "../../config/simplified.json"), "r") as f:
+        simplified = json.load(f)
+    requests = [request(simplified, users, seed) for seed in range(runs)]
+
+    print("{} runs of the simplified configuration with {} users".format(runs, users))
+
+    start = time.perf_counter()
+    for r in requests:
+        run_worker([r])
+    cold = (time.perf_counter() - start) / runs
+
+    start = time.perf_counter()
+    responses = run_worker(requests)
+    warm = (time.perf_counter() - start) / runs
+    simulation = sum(r["elapsed"] for r in responses) / runs
+
+    print("{:>16}: {:>8.1f} ms per run".format("new process", cold * 1000))
+    print("{:>16}: {:>8.1f} ms per run (simulation {:.1f} ms)".format("resident worker", warm * 1000, simulation * 1000))
+    print("{:>16}: {:.2f}x".format("speedup", cold / warm))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+from simulation.results import load_records
+from simulation.utils import StationIndex
+
+from collections import OrderedDict
+import numpy as np
+import os, sys, json, time, random, shutil, hashlib, tempfile
+
+# Content-addressed cache of the simulation runs
+#
+# A run is identified by the sha256 of the canonical JSON of the configuration (simulation.json),
+# the vehicle configuration (vehicle.json), the seed and the version of the code (hash of the source files),
+# so a change in any of them is a different run.
+# Each entry is a directory named after the key with the files produced by the run (result file, statistics.txt,
+# stations.csv, plots) and summary.json; the entries least recently used are evicted when the cache exceeds max_size.
+# The populations of users are cached in the demand directory (see DemandCache) and evicted with the runs.
+# A resident process (see worker.py) also keeps the station layouts in memory (see LayoutCache).
+#
+# Usage: python3 cache.py [list|prune|clear] [--path=DIR] [--max-size=BYTES]
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(__file__), "../cache")
+DEFAULT_MAX_SIZE = 2 * 1024**3
+
+# files of a run that aren't cached (configuration copies and logs)
+EXCLUDED = {"conf", "log.bin", "log.log", "description.txt", "output.txt"}
+
+CODE_VERSION = None
+
+def code_version() -> str:
+    # Hash of the source files of the simulator
+    global CODE_VERSION
+    if CODE_VERSION is None:
+        src = os.path.dirname(os.path.abspath(__file__))
+        h = hashlib.sha256()
+        for directory in ["", "environment", "simulation"]:
+            for name in sorted(os.listdir(os.path.join(src, directory))):
+                if name.endswith(".py"):
+                    h.update(os.path.join(directory, name).encode())
+                    with open(os.path.join(src, directory, name), "rb") as f:
+                        h.update(f.read())
+        CODE_VERSION = h.hexdigest()
+    return CODE_VERSION
+
+def run_key(config_data: dict, vehicle_data: dict, seed: int) -> str:
+    # Key of a run: hash of the canonical JSON of its inputs
+    canonical = json.dumps({"simulation": config_data, "vehicle": vehicle_data, "seed": seed, "code": code_version()},
+                           sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+def directory_size(path: str) -> int:
+    # files removed meanwhile (an entry evicted by another process) are skipped
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.path.getsize(os.path.join(root, name))
+            except FileNotFoundError:
+                continue
+    return size
+
+class DemandCache:
+    # Cache of the generated users (POPULATION records), one .npy file for each population
+    # The users depend only on the configuration of the users and of the station deployment, on the seed
+    # and on the vehicles and capacity of each station at the start (v, v_max), not on the charging configuration.
+    # Populations are loaded with memory mapping.
+
+    # configuration keys the users depend on
+    KEYS = ["users", "no_degeneration", "tries", "redistribution", "od_batch_size"]
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(self.path, exist_ok=True)
+
+    def key(self, config_data: dict, seed: int, v: np.ndarray, v_max: np.ndarray) -> str:
+        inputs = {key: config_data.get(key) for key in self.KEYS}
+        inputs["deployment"] = config_data["station"]["deployment"]
+        inputs["seed"] = seed
+        inputs["v"] = v.tolist()
+        inputs["v_max"] = v_max.tolist()
+        inputs["code"] = code_version()
+
+        canonical = json.dumps(inputs, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def file(self, key: str) -> str:
+        return os.path.join(self.path, key + ".npy")
+
+    def load(self, key: str) -> np.ndarray:
+        # Population with the given key (read-only memory map), None if it isn't cached
+        try:
+            population = np.load(self.file(key), mmap_mode="r")
+        except FileNotFoundError:
+            return None
+
+        # last use of the population, for the eviction (the mapped file stays readable if it is evicted meanwhile)
+        try:
+            os.utime(self.file(key))
+        except FileNotFoundError:
+            pass
+        return population
+
+    def store(self, key: str, population: np.ndarray):
+        # Written in a temporary file and renamed, so concurrent runs never load a partial file
+        fd, tmp = tempfile.mkstemp(dir=self.path, prefix=".tmp-", suffix=".npy")
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, population)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, self.file(key))
+
+class LayoutCache:
+    # Station layouts kept in memory by a process that runs many simulations: the positions generated by
+    # a station deployment function with its parameters and seed, and their spatial index (StationIndex,
+    # whose rows computed by a simulation are reused by the next ones). The least recently used layouts are evicted.
+    # The deployment functions seed and use the random module: its state after the generation is saved
+    # and restored when a layout is reused, so a simulation is the same with or without the cache.
+
+    def __init__(self, max_entries: int = 16):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def key(self, deployment: dict, seed: int) -> str:
+        return json.dumps({"deployment": deployment, "seed": seed}, sort_keys=True, separators=(",", ":"))
+
+    def layout(self, generate_station_positions, deployment: dict, seed: int) -> tuple:
+        # Positions and spatial index of the stations of the deployment configuration ({"type", "parameters"})
+        key = self.key(deployment, seed)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            positions, index, state = self.entries[key]
+            random.setstate(state)
+            return positions, index
+
+        positions = generate_station_positions(deployment["parameters"], seed)
+        index = StationIndex(positions)
+        self.entries[key] = (positions, index, random.getstate())
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return positions, index
+
+class Cache:
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_size: int = DEFAULT_MAX_SIZE):
+        self.path = path
+        self.max_size = max_size
+        os.makedirs(self.path, exist_ok=True)
+
+        # populations of users, in the same directory and evicted with the runs
+        self.demand = DemandCache(os.path.join(self.path, "demand"))
+
+    def entry(self, key: str) -> str:
+        return os.path.join(self.path, key)
+
+    def summary(self, key: str) -> dict:
+        # Summary of a cached run, None if the run isn't cached
+        entry = self.entry(key)
+        try:
+            with open(os.path.join(entry, "summary.json"), "r") as f:
+                summary = json.load(f)
+        except FileNotFoundError:
+            return None
+
+        # last use of the entry, for the eviction
+        try:
+            os.utime(os.path.join(entry, "summary.json"))
+        except FileNotFoundError:
+            pass
+        return summary
+
+    def get(self, key: str):
+        # Summary and trip table (structured array) of a cached run, None if the run isn't cached
+        summary = self.summary(key)
+        if summary is None:
+            return None
+        return summary, load_records(self.entry(key))
+
+    def restore(self, key: str, sim_path: str) -> dict:
+        # Copy the files of a cached run in sim_path, returns its summary (None if the run isn't cached)
+        summary = self.summary(key)
+        if summary is None:
+            return None
+
+        entry = self.entry(key)
+        try:
+            for name in os.listdir(entry):
+                if name == "summary.json":
+                    continue
+                if os.path.isdir(os.path.join(entry, name)):
+                    shutil.copytree(os.path.join(entry, name), os.path.join(sim_path, name), dirs_exist_ok=True)
+                else:
+                    shutil.copyfile(os.path.join(entry, name), os.path.join(sim_path, name))
+        except (FileNotFoundError, shutil.Error):
+            # evicted meanwhile by another process, the run is simulated again
+            return None
+        return summary
+
+    def put(self, key: str, sim_path: str, summary: dict):
+        # Store the files of a run saved in sim_path
+        # The entry is written in a temporary directory and renamed, so concurrent runs never see a partial entry
+        if os.path.exists(self.entry(key)):
+            return
+
+        tmp = tempfile.mkdtemp(dir=self.path, prefix=".tmp-")
+        for name in os.listdir(sim_path):
+            if name in EXCLUDED:
+                continue
+            if os.path.isdir(os.path.join(sim_path, name)):
+                shutil.copytree(os.path.join(sim_path, name), os.path.join(tmp, name))
+            else:
+                shutil.copyfile(os.path.join(sim_path, name), os.path.join(tmp, name))
+
+        with open(os.path.join(tmp, "summary.json"), "w") as f:
+            json.dump(summary, f, indent=4)
+
+        try:
+            os.rename(tmp, self.entry(key))
+        except OSError:
+            # stored meanwhile by another process
+            shutil.rmtree(tmp)
+
+        self.prune()
+
+    def entries(self) -> list:
+        # (key, size, last use) of each entry, from the least recently used
+        # populations of users have the key demand/KEY
+        # Several processes can evict at the same time: entries removed meanwhile are skipped
+        entries = []
+        for key in os.listdir(self.path):
+            if key.startswith(".") or key == "demand":
+                continue
+            try:
+                last_use = os.path.getmtime(os.path.join(self.entry(key), "summary.json"))
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            entries.append((key, directory_size(self.entry(key)), last_use))
+
+        for name in os.listdir(self.demand.path):
+            if name.startswith(".") or not name.endswith(".npy"):
+                continue
+            file = os.path.join(self.demand.path, name)
+            try:
+                entries.append(("demand/" + name[:-len(".npy")], os.path.getsize(file), os.path.getmtime(file)))
+            except FileNotFoundError:
+                continue
+
+        entries.sort(key=lambda e: e[2])
+        return entries
+
+    def prune(self, max_size: int = None) -> int:
+        # Evict the least recently used entries until the cache is at most max_size bytes, returns the number of evicted entries
+        max_size = self.max_size if max_size is None else max_size
+
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for key, size, _ in entries:
+            if total <= max_size:
+                break
+            # an entry evicted meanwhile by another process counts as evicted
+            if key.startswith("demand/"):
+                try:
+                    os.remove(self.demand.file(key[len("demand/"):]))
+                except FileNotFoundError:
+                    pass
+            else:
+                shutil.rmtree(self.entry(key), ignore_errors=True)
+            total -= size
+            evicted += 1
+        return evicted
+
+    def clear(self):
+        # Remove all the entries
+        for name in os.listdir(self.path):
+            shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+        os.makedirs(self.demand.path, exist_ok=True)
+
+def main():
+    path = DEFAULT_CACHE_PATH
+    max_size = None
+    command = "list"
+
+    for arg in sys.argv[1:]:
+        if arg == "-h" or arg == "--help":
+            print("Usage: python3 {} [list|prune|clear] [--path=DIR] [--max-size=BYTES]".format(sys.argv[0]))
+            print("\tlist\t\t\tShow the cached runs, from the least recently used")
+            print("\tprune\t\t\tEvict the least recently used runs until the cache is at most --max-size bytes")
+            print("\tclear\t\t\tRemove all the cached runs")
+            print("\t--path=DIR\t\tDirectory of the cache")
+            print("\t--max-size=BYTES\tMaximum size of the cache (default {})".format(DEFAULT_MAX_SIZE))
+            exit()
+
+        elif arg in ("list", "prune", "clear"):
+            command = arg
+
+        elif arg.startswith("--path="):
+            path = arg.split("=")[1]
+
+        elif arg.startswith("--max-size="):
+            max_size = int(arg.split("=")[1])
+
+    cache = Cache(path, DEFAULT_MAX_SIZE if max_size is None else max_size)
+
+    if command == "list":
+        entries = cache.entries()
+        for key, size, last_use in entries:
+            last_use = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(last_use))
+            if key.startswith("demand/"):
+                print("{}  {:>10}  {}  users".format(key[len("demand/"):][:16], size, last_use))
+                continue
+            try:
+                with open(os.path.join(cache.entry(key), "summary.json"), "r") as f:
+                    summary = json.load(f)
+            except FileNotFoundError:
+                continue
+            print("{}  {:>10}  {}  seed {}  {} trips".format(key[:16], size, last_use, summary["seed"], summary["completed_trips"]))
+        print("{} entries, {} bytes".format(len(entries), sum(size for _, size, _ in entries)))
+
+    elif command == "prune":
+        print("{} runs evicted".format(cache.prune()))
+
+    elif command == "clear":
+        cache.clear()
+
+if __name__ == "__main__":
+    main()
@@ -3,4 +3,8 @@ GETTED = (0,1)
 WAIT = (0,-1)
 END = (0,-2)
 
-timeout = lambda t: (t, TIMEOUT)
\ No newline at end of file
+ARRIVAL = 2
+
+timeout = lambda t: (t, TIMEOUT)
+# resume at the absolute time t, before the other processes scheduled at the same time (see Environment.add_arrival)
+arrival = lambda t: (t, ARRIVAL)
\ No newline at end of file
@@ -1,33 +1,118 @@
-from environment.utils import sortedlist
 from environment.process import Process
+from environment.event import Event
+from environment.scheduler import Scheduler, HeapQueue
 from environment.constants import *
 
+import itertools, math
+
+class StopSimulation(Exception):
+    # Raised by Environment.stop to end run() from a process or an event
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
 class Environment:
-    def __init__(self):
+    def __init__(self, scheduler: Scheduler = None):
         self.time = 0
-        self.processes = sortedlist()
+        # event queue of (time, sequence, process) entries
+        # the sequence number breaks ties so that processes scheduled at the same time run in FIFO order
+        self.processes = scheduler if scheduler is not None else HeapQueue()
+        self.sequence = itertools.count()
+        # sequence numbers of the arrivals, lower than all the others:
+        # arrivals run before the other processes scheduled at the same time, in the order they are added
+        self.arrivals = itertools.count(-2**62)
 
     def now(self):
         return self.time
 
-    def add_process(self, process: Process):
-        self.processes.insert(process)
+    def add_process(self, process: Process) -> Process:
+        # the process is also the handle used to cancel it
+        self.processes.push((process.time, next(self.sequence), process))
+        return process
 
-    def run(self, until=None):
-        while self.processes and (until is None or self.time < until):
-            process = self.processes.pop(0)
-            self.time = process.time
-            
-            signal = process.next()
-
-            if signal == END or signal == WAIT:
-                continue
-            elif signal == GETTED:
-                self.processes.insert(process)
-            elif signal[1] == TIMEOUT:
-                process.time = self.time + signal[0]
-                self.processes.insert(process)
+    def call_at(self, time, callback, *args) -> Event:
+        # Call callback(*args) at the given time, returns the event (the handle used to cancel it)
+        event = Event(time, callback, args)
+        self.processes.push((time, next(self.sequence), event))
+        return event
+
+    def call_in(self, delay, callback, *args) -> Event:
+        # Call callback(*args) after delay units of time
+        event = Event(self.time + delay, callback, args)
+        self.processes.push((event.time, next(self.sequence), event))
+        return event
+
+    def add_arrival(self, process: Process) -> Process:
+        # Add a process that starts before the other processes scheduled at the same time
+        self.processes.push((process.time, next(self.arrivals), process))
+        return process
+
+    def add_source(self, processes) -> Process:
+        # Add the processes of an iterable sorted by start time one at a time:
+        # each process is added when the previous one starts, so only the next arrival is in the event queue.
+        # The processes start in the same order as if they were all added with add_process before running
+        return self.add_arrival(Process(self.time, self.source(iter(processes))))
+
+    def source(self, processes):
+        # Generator of the process added by add_source
+        for process in processes:
+            if process.time < self.time:
+                raise Exception("Arrivals must be sorted by time")
+            if process.time > self.time:
+                yield arrival(process.time)
+            self.add_arrival(process)
+
+    def stop(self, reason: str):
+        # Stop run() from a process or an event (the rest of the caller isn't executed), run() returns the reason
+        raise StopSimulation(reason)
+
+    def cancel(self, process: Process):
+        # Cancel a scheduled process in O(1): the entry stays in the event queue as a tombstone
+        # and is discarded when popped, the generator is never resumed
+        process.cancelled = True
+
+    def run(self, until=None) -> str:
+        # Run the processes and events scheduled before until (all of them if None), returns why it stopped:
+        # "empty" when there is nothing left to run, "until" when the next entry is at or after until
+        # (the entry stays in the event queue and the time is set to until), the reason given to stop otherwise
+        processes = self.processes
+        push, pop = processes.push, processes.pop
+        sequence, arrivals = self.sequence, self.arrivals
+        event = Event
+        until = math.inf if until is None else until
+        try:
+            while processes:
+                entry = pop()
+                time, _, process = entry
+                if process.cancelled:
+                    continue
+                if time >= until:
+                    push(entry)
+                    self.time = until
+                    return "until"
+                self.time = time
+
+                # events: call the function, no signal to dispatch
+                if process.__class__ is event:
+                    process.callback(*process.args)
+                    continue
+                
+                signal = process.next()
+
+                if signal == END or signal == WAIT:
+                    continue
+                elif signal == GETTED:
+                    push((process.time, next(sequence), process))
+                elif signal[1] == TIMEOUT:
+                    process.time = self.time + signal[0]
+                    push((process.time, next(sequence), process))
+                elif signal[1] == ARRIVAL:
+                    process.time = signal[0]
+                    push((process.time, next(arrivals), process))
+        except StopSimulation as stop:
+            return stop.reason
+        return "empty"
             
     def awake(self, process: Process):
         process.time = self.time
-        self.processes.insert(process)
+        self.processes.push((process.time, next(self.sequence), process))
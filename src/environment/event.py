@@ -0,0 +1,13 @@
+class Event:
+    # Lightweight alternative to a Process: a function called at a given time (see Environment.call_at)
+    # No generator and no signal: the Environment calls callback(*args) when the event is popped.
+    # An event can also wait on a resource (Lock, Slots) in place of a process,
+    # the callback is called when the resource awakes it.
+    __slots__ = ("time", "callback", "args", "cancelled")
+
+    def __init__(self, time, callback, args: tuple = ()):
+        self.time = time
+        self.callback = callback
+        self.args = args
+        # set by Environment.cancel, a cancelled event is discarded when popped from the event queue
+        self.cancelled = False
@@ -1,12 +1,13 @@
 from environment.constants import *
 
-class Interrupt(Exception):
-    pass
-
 class Process:
+    __slots__ = ("time", "generator", "cancelled")
+
     def __init__(self, time, generator):
         self.time = time
         self.generator = generator
+        # set by Environment.cancel, a cancelled process is discarded when popped from the event queue
+        self.cancelled = False
     
     def next(self):
         try:
@@ -18,15 +19,3 @@ class Process:
                 return END
             else:
                 raise e
-        
-    def interrupt(self):
-        self.generator.throw(Interrupt())
-
-    def __eq__(self, other):
-        return self.time == other.time
-    
-    def __lt__(self, other):
-        return self.time < other.time
-    
-    def __gt__(self, other):
-        return self.time > other.time
\ No newline at end of file
@@ -1,51 +1,118 @@
 from environment.env import Environment
 from environment.constants import *
 
-class Lock:
+from collections import deque
+
+class Resource:
+    # Accounting of a resource, updated at each change of its state with the time elapsed since the previous change:
+    # - waiting_time: integral of the queue length over time, equal to the total time waited by the processes
+    #   (the ones still waiting included, up to now)
+    # - busy_time: integral of the busy part of the resource (see busy) over time
+    # - requests, waits: number of requests and of the ones that had to wait, max_waiting: maximum queue length
+
     def __init__(self, env: Environment):
         self.env = env
+        self.waiting = deque()
+
+        self.start = self.last = env.time
+        self.waiting_time = 0
+        self.busy_time = 0
+        self.requests = 0
+        self.waits = 0
+        self.max_waiting = 0
+
+    def busy(self) -> float:
+        # Fraction of the resource in use
+        return 0
+
+    def account(self):
+        # Accumulate the state since the last change, called before every change
+        now = self.env.time
+        if now != self.last:
+            elapsed = now - self.last
+            self.waiting_time += len(self.waiting) * elapsed
+            self.busy_time += self.busy() * elapsed
+            self.last = now
+
+    def wait(self, process):
+        self.waiting.append(process)
+        self.waits += 1
+        if len(self.waiting) > self.max_waiting:
+            self.max_waiting = len(self.waiting)
+
+    def stats(self) -> dict:
+        # Accounting up to now: average queue length and busy fraction are averages over time
+        # busy_fraction is the average of busy, not a utilization: for a Lock the fraction of time it is locked
+        # (for the unlock queue of a station, no vehicle available), for Slots the average fraction of the slots in use
+        self.account()
+        elapsed = self.last - self.start
+        return {
+            "requests": self.requests,
+            "waits": self.waits,
+            "max_queue": self.max_waiting,
+            "avg_queue": self.waiting_time / elapsed if elapsed else 0,
+            "total_wait": self.waiting_time,
+            "busy_fraction": self.busy_time / elapsed if elapsed else 0,
+        }
+
+class Lock(Resource):
+    # busy while locked
+    def __init__(self, env: Environment):
+        super().__init__(env)
         self.locked = True
-        self.waiting = []
+
+    def busy(self) -> float:
+        return 1 if self.locked else 0
 
     def request(self, process) -> tuple:
+        self.account()
+        self.requests += 1
         if self.locked:
-            self.waiting.append(process)
+            self.wait(process)
             return WAIT
         else:
             self.locked = True
             return GETTED
 
     def release(self):
+        self.account()
         if self.waiting:
-            process = self.waiting.pop(0)
+            process = self.waiting.popleft()
             self.env.awake(process)
         else:
             self.locked = False
 
     def block(self):
+        self.account()
         self.locked = True
 
 class CapacityOutOfBound(Exception):
     pass
 
-class Slots:
+class Slots(Resource):
+    # busy: fraction of the slots in use
     def __init__(self, env: Environment, capacity: int):
-        self.env = env
+        super().__init__(env)
         self.capacity = capacity
         self.available = capacity
-        self.waiting = []
+
+    def busy(self) -> float:
+        return (self.capacity - self.available) / self.capacity if self.capacity else 0
 
     def request(self, process) -> tuple:
+        self.account()
+        self.requests += 1
         if self.available > 0:
             self.available -= 1
             return GETTED
         else:
-            self.waiting.append(process)
+            self.wait(process)
             return WAIT
 
     def release(self):
+        self.account()
         if self.waiting:
-            process = self.waiting.pop(0)
+            process = self.waiting.popleft()
             self.env.awake(process)
             return True
         else:
@@ -55,4 +122,5 @@ class Slots:
             return False
 
     def initial(self, n: int):
-        self.available = n
\ No newline at end of file
+        self.account()
+        self.available = n
@@ -0,0 +1,116 @@
+import heapq
+from abc import ABC, abstractmethod
+
+class Scheduler(ABC):
+    # Base class for the event queue used by the Environment
+    # Entries are (time, sequence, process) tuples, the sequence number is assigned by the Environment
+    # and breaks ties between entries with the same time (FIFO order)
+    # Every scheduler must pop the entries in exactly (time, sequence) order
+    # so that the results of a simulation don't depend on the scheduler used
+
+    # Warning: the __init__ method requires the following parameters:
+    # - params: dict
+    # will always be called with these parameters and only these parameters
+
+    @abstractmethod
+    def push(self, entry: tuple):
+        # Add an entry to the queue
+        pass
+
+    @abstractmethod
+    def pop(self) -> tuple:
+        # Remove and return the entry with the lowest (time, sequence)
+        pass
+
+    @abstractmethod
+    def __len__(self):
+        # Number of entries in the queue
+        pass
+
+class HeapQueue(Scheduler):
+    # Binary heap: O(log n) push and pop
+
+    def __init__(self, params: dict = None):
+        self.heap = []
+
+    def push(self, entry: tuple):
+        heapq.heappush(self.heap, entry)
+
+    def pop(self) -> tuple:
+        return heapq.heappop(self.heap)
+
+    def __len__(self):
+        return len(self.heap)
+
+class CalendarQueue(Scheduler):
+    # Calendar queue (bucketed time wheel): amortized O(1) push and pop
+    # when the events are spread over a bounded horizon from the current time,
+    # like the short timeouts of trips and charges and the immediate awakes
+    #
+    # The time axis is divided in "days" of bucket_width, day n is stored in bucket n % len(buckets)
+    # Each bucket is a small heap, so entries of the same day are popped in (time, sequence) order
+    # The number of buckets doubles/halves with the number of entries to keep buckets short
+
+    def __init__(self, params: dict = None):
+        # params: {
+        #     "bucket_width": float,  (default 1.0)
+        #     "buckets": int          (initial number of buckets, default 64)
+        # }
+        params = params or {}
+
+        self.width = params.get("bucket_width", 1.0)
+        if self.width <= 0:
+            raise ValueError("bucket_width must be positive")
+
+        self.min_buckets = params.get("buckets", 64)
+        self.buckets = [[] for _ in range(self.min_buckets)]
+        self.size = 0
+
+        # day of the last popped entry, no entry in the queue belongs to a previous day
+        self.day = 0
+
+    def push(self, entry: tuple):
+        day = int(entry[0] // self.width)
+        if day < self.day:
+            self.day = day
+        heapq.heappush(self.buckets[day % len(self.buckets)], entry)
+        self.size += 1
+
+        if self.size > 2 * len(self.buckets):
+            self.resize(2 * len(self.buckets))
+
+    def pop(self) -> tuple:
+        if self.size == 0:
+            raise IndexError("pop from an empty calendar queue")
+
+        buckets = self.buckets
+        n = len(buckets)
+        width = self.width
+
+        # scan one year of buckets starting from the current day
+        for day in range(self.day, self.day + n):
+            bucket = buckets[day % n]
+            if bucket and bucket[0][0] // width <= day:
+                break
+        else:
+            # no entry in the next year, jump directly to the day of the earliest entry
+            day = min(int(bucket[0][0] // width) for bucket in buckets if bucket)
+            bucket = buckets[day % n]
+
+        self.day = day
+        entry = heapq.heappop(bucket)
+        self.size -= 1
+
+        if self.size < len(buckets) // 2 and len(buckets) > self.min_buckets:
+            self.resize(len(buckets) // 2)
+
+        return entry
+
+    def resize(self, n: int):
+        entries = [entry for bucket in self.buckets for entry in bucket]
+        self.buckets = [[] for _ in range(n)]
+        for entry in entries:
+            heapq.heappush(self.buckets[int(entry[0] // self.width) % n], entry)
+
+    def __len__(self):
+        return self.size
@@ -1,8 +1,12 @@
-from environment.env import Environment
-from simulation.utils import setup_logger, create_directory_path, load_config
+from simulation.utils import create_directory_path, load_config
+from simulation import trace
 
-from setup import setup_simulation
-from analisys import analyze_results
+from simulator import Simulation
+from setup import simplified_configuration
+from cache import Cache, LayoutCache, run_key
+
+# analisys and plots are imported when the results are analyzed (see run_simulation), they are the largest part
+# of the startup time and a run with --no-analysis doesn't need them
 
 import random, os, json, shutil, sys
 
@@ -10,6 +14,21 @@ def main():
     # random seed
     seed = random.randint(0, 1000000)
 
+    # event queue used by the environment, None means the one in the configuration file
+    scheduler_type = None
+
+    # use the simplified configuration (config/simplified.json)
+    simplified = False
+
+    # cache of the simulation runs, None means no cache
+    cache = None
+
+    # plots to render, None means all of them and an empty list none (only the statistics)
+    plots = None
+
+    # analyze the results (statistics and plots), otherwise only the result file is written
+    analyze = True
+
     # path to the default directory where the results will be saved
     path = os.path.join(os.path.dirname(__file__), "../results")
 
@@ -29,183 +48,136 @@ def main():
     # command line options
     for arg in args:
         if arg == "-h" or arg == "--help":
-            print("Usage: python3 {} [-s|--simplified] [--seed=SEED] [-log|--log]".format(sys.argv[0]))
+            print("Usage: python3 {} [-s|--simplified] [--seed=SEED] [--scheduler=TYPE] [-log|--log[=CATEGORIES]] [--cache[=DIR]] [--no-plots|--stats-only|--plots=NAME,...] [--no-analysis]".format(sys.argv[0]))
             print("\t-s|--simplified\t\tRun the simulation with the simplified configuration")
             print("\t--seed=SEED\t\tSet the seed for the random number generator")
+            print("\t--scheduler=TYPE\tEvent queue of the environment (HeapQueue, CalendarQueue)")
             print("\t-log|--log\t\tEnable logging")
+            print("\t--log=CATEGORIES\tEnable logging of the given categories only (comma separated: user, station, charge)")
+            print("\t--cache[=DIR]\t\tReuse the results of an identical run (same configuration, seed and code) if cached")
+            print("\t--no-plots|--stats-only\tOnly the statistics, the plots can be rendered later with plots.py")
+            print("\t--plots=NAME,...\tRender only the given plots (comma separated, see plots.py)")
+            print("\t--no-analysis\t\tOnly the result file, it can be analyzed later with analisys.py")
             exit()
         
         elif arg == "-s" or arg == "--simplified":
-            print("Running simplified simulation")
-            # load simplified configuration
-            simplified_config = load_config(os.path.join(os.path.dirname(__file__),"../config/simplified.json"))
-
-            # use simplified configuration as description
-            with open(os.path.join(sim_path, "description.txt"), "w") as f:
-                shutil.copyfile(os.path.join(os.path.dirname(__file__),"../config/simplified.json"), os.path.join(sim_path, "description.txt"))
-
-            # modify vehicle.json
-            with open(os.path.join(os.path.dirname(__file__),"../config/vehicle.json"), "r") as f:
-                vehicle_data = json.load(f)
-                vehicle_data["Scooter"]["BATTERY_CAPACITY"] = 1000
-                vehicle_data["Scooter"]["ENERGY_CONSUMPTION"] = 1000/simplified_config["vehicle"]["autonomy"]
-
-            with open(os.path.join(os.path.dirname(__file__),"../config/vehicle.json"), "w") as f:
-                json.dump(vehicle_data, f, indent=4)
-
-            # create configuration files for the simplified configuration
-            configuration = """{
-    "station": {
-        "charge_per_time": CHARGE_PER_TIME,
-        "max_concurrent_charging": MAX_CONCURRENT_CHARGING,
-        
-        "storage":{
-            "type": "TYPE",
-            "parameters": PARAMETERS
-        },
-
-        "deployment": {
-            "type": "grid_cells",
-            "parameters": {
-                "rows": ROWS,
-                "columns": COLUMNS,
-                "width": WIDTH,
-                "min_distance": STAT_MIN_DISTANCE
-            }
-        }
-    },
-
-    "vehicles": {
-        "type": ["Scooter"],
-        
-        "deployment": {
-            "type": "uniform",
-            "parameters": {
-                "vehicles_per_station": VEHICLES_PER_STATION
-            }
-        }
-    },
-
-    "users": {
-        "linear": LINEAR,
-        "normal": NORMAL,
-        "mean_distance": MEAN_DISTANCE,
-        "max_distance": MAX_DISTANCE,
-        "min_distance": MIN_DISTANCE,
-        "mean_velocity": MEAN_VELOCITY,
-        "max_velocity": MAX_VELOCITY,
-        "min_velocity": MIN_VELOCITY
-    },
-    
-    "no_degeneration": NO_DEGENERATION,
-    "v_per_station": VEHICLES_PER_STATION,
-    "station_capacity": STATION_CAPACITY,
-    "tries": 5000,
-    "redistribution": REDISTRIBUTION,
-
-    "run_time": RUN_TIME
-}"""
-
-            radice = simplified_config["stations"]["number"]**0.5
-            if radice - int(radice) < 0.5:
-                radice = int(radice)
-            else:
-                radice = int(radice) + 1
-
-            storage = {"capacity": simplified_config["stations"]["capacity"]} if simplified_config["stations"]["type"] == "LIFO" else {"stack1_size": simplified_config["stations"]["capacity"]//2,"stack2_size": simplified_config["stations"]["capacity"]//2}
-
-            linear = [
-                [0, 60, 245/10000*simplified_config["users"]["number"]],
-                [60, 90, 139/10000*simplified_config["users"]["number"]],
-                [90, 120, 155/10000*simplified_config["users"]["number"]],
-                [120, 150, 171/10000*simplified_config["users"]["number"]],
-                [150, 180, 188/10000*simplified_config["users"]["number"]],
-                [180, 1080, 6122/10000*simplified_config["users"]["number"]]
-            ]
-            normal = [
-                [60, 180, 857/10000*simplified_config["users"]["number"]],
-                [420, 540, 286/10000*simplified_config["users"]["number"]],
-                [720, 960, 1837/10000*simplified_config["users"]["number"]]
-            ]
-
-            placeholders = ["VEHICLES_PER_STATION", "CHARGE_PER_TIME", "MAX_CONCURRENT_CHARGING", "ROWS", "COLUMNS", "WIDTH", "STAT_MIN_DISTANCE", "TYPE", "PARAMETERS", "LINEAR", "NORMAL", "MEAN_DISTANCE", "MAX_DISTANCE", "MIN_DISTANCE", "MEAN_VELOCITY", "MAX_VELOCITY", "MIN_VELOCITY", "NO_DEGENERATION", "STATION_CAPACITY", "REDISTRIBUTION", "RUN_TIME"]
-            substitutions= [simplified_config["stations"]["vehicles_per_station"],
-                            1000/simplified_config["stations"]["recharge_time"],
-                            simplified_config["stations"]["max_simultaneous_recharge"],
-                            radice,
-                            radice,
-                            simplified_config["stations"]["distance"],
-                            simplified_config["stations"]["min_distance"],
-                            simplified_config["stations"]["type"],
-                            str(storage).replace("'", '"'),
-                            linear,
-                            normal,
-                            simplified_config["users"]["average_distance"],
-                            simplified_config["users"]["max_distance"],
-                            simplified_config["users"]["min_distance"],
-                            simplified_config["vehicle"]["average_speed"],
-                            simplified_config["vehicle"]["max_speed"],
-                            simplified_config["vehicle"]["min_speed"],
-                            str(simplified_config["no_degeneration"]).lower(),
-                            simplified_config["stations"]["capacity"],
-                            simplified_config["users"]["number"]//10,
-                            simplified_config["run_time"]]
-            
-            # replace placeholders
-            for i in range(len(placeholders)):
-                configuration = configuration.replace(placeholders[i], str(substitutions[i]))
-
-            # write configuration to file
-            with open(os.path.join(os.path.dirname(__file__), "../config/simulation.json"), "w") as f:
-                print(configuration, file=f)
+            simplified = True
         
         elif arg == "-log" or arg == "--log":
-            setup_logger(os.path.join(sim_path, "log.log"))
+            trace.enable(os.path.join(sim_path, "log.bin"))
+
+        elif arg.startswith("--log="):
+            trace.enable(os.path.join(sim_path, "log.bin"), arg.split("=")[1].split(","))
 
         elif arg.startswith("--seed="):
             seed = int(arg.split("=")[1])
 
+        elif arg.startswith("--scheduler="):
+            scheduler_type = arg.split("=")[1]
+
+        elif arg == "--cache":
+            cache = Cache()
+
+        elif arg.startswith("--cache="):
+            cache = Cache(arg.split("=")[1])
+
+        elif arg == "--no-plots" or arg == "--stats-only":
+            plots = []
+
+        elif arg.startswith("--plots="):
+            from plots import check_names
+            plots = check_names(arg.split("=")[1].split(","))
+
+        elif arg == "--no-analysis":
+            analyze = False
+
     # seed for reproducibility
     print("Seed: {}".format(seed))
 
     # caricamento file di configurazione
-    config_data = load_config(os.path.join(os.path.dirname(__file__),"../config/simulation.json"))
-
-    # make a copy of the configuration files
-    os.makedirs(os.path.join(sim_path, "conf"))
-    shutil.copyfile(os.path.join(os.path.dirname(__file__),"../config/simulation.json"), os.path.join(sim_path, "conf/simulation.json"))
-    shutil.copyfile(os.path.join(os.path.dirname(__file__),"../config/vehicle.json"), os.path.join(sim_path, "conf/vehicle.json"))
+    vehicle_data = load_config(os.path.join(os.path.dirname(__file__),"../config/vehicle.json"))
 
-    # crea file per i risultati della simulazione
-    result_path = os.path.join(sim_path, "result.csv")
+    if simplified:
+        print("Running simplified simulation")
+        # load simplified configuration
+        simplified_config = load_config(os.path.join(os.path.dirname(__file__),"../config/simplified.json"))
 
-    column_names = ["User ID", "Start Time", "From Station", "To Station", "Vehicle ID", "Unlock Time", "Lock Time", "Total Time", "Battery Used", "Distance", "Velocity"]
-    with open(result_path, "w") as f:
-        print(",".join(column_names), file=f)
+        # use simplified configuration as description
+        shutil.copyfile(os.path.join(os.path.dirname(__file__),"../config/simplified.json"), os.path.join(sim_path, "description.txt"))
 
-    # inizializzazione ambiente
-    env = Environment()
+        # configuration files of the simplified configuration, built in memory
+        config_data, vehicle_data = simplified_configuration(simplified_config, vehicle_data)
+    else:
+        config_data = load_config(os.path.join(os.path.dirname(__file__),"../config/simulation.json"))
 
-    # setup simulation
-    print("Setting up simulation...", end="\n\t")
-    
-    setup_simulation(env, config_data, seed)
+    run_simulation(config_data, vehicle_data, seed, sim_path, scheduler_type, cache, plots, analyze)
 
-    # esecuzione simulazione
-    print("Starting simulation...", end=" ")
+    print("\nYou can find all the files produced by the simulation in : {}".format(sim_path))
 
-    env.run()
+def run_simulation(config_data: dict, vehicle_data: dict, seed: int, sim_path: str, scheduler_type: str = None, cache: Cache = None, plots: list = None, analyze: bool = True, layout_cache: LayoutCache = None) -> dict:
+    # Run a simulation with the given configurations (content of simulation.json and vehicle.json)
+    # and save the files it produces in sim_path (an existing directory)
+    # The configuration files aren't read or modified, returns the summary of analyze_results
+    # With a cache, the files of an identical run are copied instead of simulating again (not while logging)
+    # plots: plots to render (all if None, none if empty), see analyze_results
+    # Without analyze the results aren't analyzed (nor cached): the summary has only the number of trips and the stop reason
+    # layout_cache: station layouts shared by the simulations of the same process (see cache.LayoutCache)
 
-    print("Simulation finished\n")
+    # make a copy of the configuration files
+    os.makedirs(os.path.join(sim_path, "conf"))
+    with open(os.path.join(sim_path, "conf/simulation.json"), "w") as f:
+        json.dump(config_data, f, indent=4)
+    with open(os.path.join(sim_path, "conf/vehicle.json"), "w") as f:
+        json.dump(vehicle_data, f, indent=4)
+
+    key = None
+    if cache is not None and trace.FILE is None:
+        key = run_key(config_data, vehicle_data, seed)
+        summary = cache.restore(key, sim_path)
+        if summary is not None:
+            print("Loaded from cache: {}".format(key))
+            # plots not rendered by the cached run, from its histograms
+            # (computed from its result file if it was run with only the statistics)
+            if analyze:
+                from plots import load_histograms, histograms_from_file, save_histograms, missing_plots, render_plots
+                missing = missing_plots(sim_path, plots)
+                if missing:
+                    histograms = load_histograms(sim_path)
+                    if histograms is None:
+                        histograms = histograms_from_file(sim_path, config_data.get("analysis", {}).get("chunk_size", 65536))
+                        save_histograms(sim_path, histograms)
+                    render_plots(sim_path, histograms, missing)
+            return summary
+
+    # simulazione, i risultati sono scritti in sim_path
+    simulation = Simulation(config_data, vehicle_data, seed, scheduler_type, sim_path, None if cache is None else cache.demand, layout_cache, verbose=True)
+    stop_reason = simulation.simulate()
+    env, results = simulation.env, simulation.results
+
+    # scrittura del log in formato testo
+    if trace.FILE is not None:
+        trace.disable()
+        with open(os.path.join(sim_path, "log.log"), "w") as f:
+            trace.render(os.path.join(sim_path, "log.bin"), f)
+
+    print("Simulation finished ({} at {})\n".format(stop_reason, env.now()))
+
+    if not analyze:
+        return {"seed": seed, "completed_trips": len(results), "stop_reason": stop_reason, "end_time": env.now()}
 
     # analisi risultati
     print("Analyzing results...", end="\n\t")
 
-    analyze_results(sim_path, config_data, seed)
+    from analisys import analyze_results
+    summary = analyze_results(sim_path, config_data, seed, simulation.stations, results.records() if results.keep else None, stop_reason, env.now(), simulation.accumulator, plots)
     
     print("analyzed")
 
-    print("\nYou can find all the files produced by the simulation in : {}".format(sim_path))
+    # a run stopped by the wall clock depends on the machine, it isn't reproducible
+    if key is not None and stop_reason != "wall_time":
+        cache.put(key, sim_path, summary)
+
+    return summary
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
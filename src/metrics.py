@@ -0,0 +1,298 @@
+import numpy as np
+import copy
+
+# Statistics of the completed trips, used by analyze_results
+#
+# describe computes all the statistics of a column with NumPy reductions and a single sort
+# (median and mode from the sorted values), trip_statistics all the columns of the trip table.
+# TripAccumulator computes the same statistics online, fed with blocks of trips during the simulation
+# or read from the result file (see simulation.results.iter_records), so the trip table is never needed:
+# moments are exact, medians come from a KLL sketch and modes are binned.
+
+STATISTICS = ["mean", "max", "min", "median", "mode", "var"]
+
+# statistics of the trip table: name -> column (trip time is total time - lock time - unlock time)
+COLUMN_METRICS = {
+    "distance": "Distance",
+    "velocity": "Velocity",
+    "lock_time": "Lock Time",
+    "unlock_time": "Unlock Time",
+    "trip_time": None,
+    "total_time": "Total Time",
+}
+
+# statistics of the number of trips of each group: name -> column of the group
+COUNT_METRICS = {
+    "departures_per_station": "From Station",
+    "arrivals_per_station": "To Station",
+    "trips_per_vehicle": "Vehicle ID",
+}
+
+def describe(values: np.ndarray, mode_bins: int = None) -> dict:
+    # Mean, max, min, median, mode and variance (ddof 1, like pandas) of values
+    # The mode is the most frequent value (the smallest one if tied, like pandas),
+    # with mode_bins it is the center of the most populated bin of a histogram of mode_bins bins
+    values = np.asarray(values)
+    if len(values) == 0:
+        return dict.fromkeys(STATISTICS, np.nan)
+
+    # mean and variance on the values in their order, so they are rounded like pandas
+    mean = values.mean()
+    var = values.var(ddof=1) if len(values) > 1 else np.nan
+
+    ordered = np.sort(values)
+    n = len(ordered)
+    median = (ordered[(n - 1) // 2] + ordered[n // 2]) / 2
+
+    if mode_bins is None:
+        # runs of equal values in the sorted values, the mode starts the longest one
+        starts = np.flatnonzero(np.concatenate(([True], ordered[1:] != ordered[:-1])))
+        lengths = np.diff(np.append(starts, n))
+        mode = ordered[starts[lengths.argmax()]]
+    else:
+        counts, edges = np.histogram(ordered, bins=mode_bins)
+        k = counts.argmax()
+        mode = (edges[k] + edges[k + 1]) / 2
+
+    return {"mean": mean, "max": ordered[-1], "min": ordered[0], "median": median, "mode": mode, "var": var}
+
+def group_counts(ids: np.ndarray) -> np.ndarray:
+    # Number of trips of each id that appears in ids (like groupby(...).count())
+    counts = np.bincount(np.asarray(ids))
+    return counts[counts > 0]
+
+def trip_times(table) -> np.ndarray:
+    # computed in float64 also from the compact float32 columns
+    return np.asarray(table["Total Time"], dtype=np.float64) - np.asarray(table["Lock Time"], dtype=np.float64) - np.asarray(table["Unlock Time"], dtype=np.float64)
+
+def trip_statistics(table, mode_bins: int = None) -> dict:
+    # Statistics of each metric of the trip table (structured array or DataFrame)
+    # The mode of the counts is always exact, mode_bins applies to the columns
+    statistics = {}
+    for name, column in COLUMN_METRICS.items():
+        values = trip_times(table) if column is None else table[column]
+        statistics[name] = describe(values, mode_bins)
+    for name, column in COUNT_METRICS.items():
+        statistics[name] = describe(group_counts(table[column]))
+    return statistics
+
+class Moments:
+    # Count, mean, variance, min and max updated with blocks of values
+    # Blocks are combined with the parallel algorithm of Chan et al., two Moments can be merged
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0       # sum of the squared deviations from the mean
+        self.min = np.inf
+        self.max = -np.inf
+
+    def update(self, values: np.ndarray):
+        if len(values) == 0:
+            return
+        values = np.asarray(values, dtype=np.float64)
+        other = Moments()
+        other.count = len(values)
+        other.mean = values.mean()
+        other.m2 = ((values - other.mean)**2).sum()
+        other.min = values.min()
+        other.max = values.max()
+        self.merge(other)
+
+    def merge(self, other):
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta**2 * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def var(self) -> float:
+        # ddof 1, like pandas
+        return self.m2 / (self.count - 1) if self.count > 1 else np.nan
+
+class BinnedCounts:
+    # Number of values in each bin of width bin_width, for modes and quantiles
+    # The counts are an array of the bins from the lowest to the highest one seen (offset is the index of the first one)
+    # When the values span more than max_bins bins the width is doubled, so the memory is bounded
+    # The error of the mode and of the quantiles is at most half a bin
+    def __init__(self, bin_width: float, max_bins: int = 1 << 18):
+        self.width = bin_width
+        self.max_bins = max_bins
+        self.offset = 0
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    def coarsen(self):
+        # Double the width of the bins, merging each even bin with the next one
+        counts = self.counts
+        if self.offset % 2:
+            counts = np.concatenate(([0], counts))
+        if len(counts) % 2:
+            counts = np.append(counts, 0)
+        self.offset = (self.offset - self.offset % 2) // 2
+        self.counts = counts.reshape(-1, 2).sum(axis=1)
+        self.width *= 2
+
+    def add(self, offset: int, counts: np.ndarray):
+        if len(counts) == 0:
+            return
+        if len(self.counts) == 0:
+            self.offset, self.counts = offset, counts.astype(np.int64)
+            return
+        low = min(self.offset, offset)
+        high = max(self.offset + len(self.counts), offset + len(counts))
+        if low != self.offset or high != self.offset + len(self.counts):
+            grown = np.zeros(high - low, dtype=np.int64)
+            grown[self.offset - low:self.offset - low + len(self.counts)] = self.counts
+            self.offset, self.counts = low, grown
+        self.counts[offset - self.offset:offset - self.offset + len(counts)] += counts
+
+    def update(self, values: np.ndarray):
+        if len(values) == 0:
+            return
+        values = np.asarray(values, dtype=np.float64)
+        while True:
+            bins = np.floor(values / self.width).astype(np.int64)
+            low, high = int(bins.min()), int(bins.max())
+            if len(self.counts):
+                low, high = min(low, self.offset), max(high, self.offset + len(self.counts) - 1)
+            if high - low < self.max_bins:
+                break
+            self.coarsen()
+        low = bins.min()
+        self.add(int(low), np.bincount(bins - low))
+
+    def merge(self, other):
+        # the widths are bin_width times a power of 2, the finer counts are coarsened to the wider bins
+        while self.width < other.width:
+            self.coarsen()
+        if other.width < self.width:
+            other = copy.deepcopy(other)
+            while other.width < self.width:
+                other.coarsen()
+        self.add(other.offset, other.counts)
+
+    def mode(self) -> float:
+        # center of the most populated bin (the lowest one if tied)
+        return (self.offset + self.counts.argmax() + 0.5) * self.width
+
+    def quantile(self, q: float) -> float:
+        # center of the bin of the value of rank q * (count - 1)
+        cumulative = np.cumsum(self.counts)
+        k = np.searchsorted(cumulative, q * (cumulative[-1] - 1), side="right")
+        return (self.offset + k + 0.5) * self.width
+
+class KLL:
+    # KLL quantile sketch (Karnin, Lang, Liberty): the values are kept in levels of compactors,
+    # a value at level h stands for 2**h values. When a level is over its capacity it is sorted
+    # and every other value (starting from a random one) is promoted to the next level.
+    # The size is O(k log(n/k)) and the rank error of a quantile is about 1.7/k (1.65% with k 200);
+    # the random choices use a fixed seed, so the same values give the same quantiles.
+    def __init__(self, k: int = 200, seed: int = 0):
+        self.k = k
+        self.levels = [np.empty(0)]
+        self.count = 0
+        self.rng = np.random.default_rng(seed)
+
+    def capacity(self, level: int) -> int:
+        # the top level has capacity k, each level below 2/3 of the one above it
+        return max(2, int(self.k * (2 / 3)**(len(self.levels) - 1 - level)))
+
+    def update(self, values: np.ndarray):
+        self.levels[0] = np.concatenate((self.levels[0], np.asarray(values, dtype=np.float64)))
+        self.count += len(values)
+        self.compress()
+
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for h, items in enumerate(other.levels):
+            self.levels[h] = np.concatenate((self.levels[h], items))
+        self.count += other.count
+        self.compress()
+
+    def compress(self):
+        h = 0
+        while h < len(self.levels):
+            items = self.levels[h]
+            if len(items) > self.capacity(h):
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # an odd number of values leaves the last one at this level
+                keep = items[len(items) - len(items) % 2:]
+                items = items[:len(items) - len(items) % 2]
+                self.levels[h + 1] = np.concatenate((self.levels[h + 1], items[self.rng.integers(2)::2]))
+                self.levels[h] = keep
+            h += 1
+
+    def quantile(self, q: float) -> float:
+        # value of rank q * count among the values seen
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2**h) for h, items in enumerate(self.levels)])
+        order = np.argsort(values, kind="stable")
+        cumulative = np.cumsum(weights[order])
+        k = min(np.searchsorted(cumulative, q * cumulative[-1]), len(values) - 1)
+        return values[order][k]
+
+class TripAccumulator:
+    # Statistics of the trips fed in blocks (structured arrays with the columns of the trip table)
+    # Memory doesn't depend on the number of trips: moments, a quantile sketch and binned values for each column,
+    # number of trips for each station and vehicle. Two accumulators can be merged.
+    def __init__(self, bin_width: float = 0.01, sketch_k: int = 200):
+        self.bin_width = bin_width
+        self.count = 0
+        self.moments = {name: Moments() for name in COLUMN_METRICS}
+        self.sketches = {name: KLL(sketch_k) for name in COLUMN_METRICS}
+        self.bins = {name: BinnedCounts(bin_width) for name in COLUMN_METRICS}
+        self.groups = {name: np.zeros(0, dtype=np.int64) for name in COUNT_METRICS}
+
+    def update(self, records: np.ndarray):
+        if len(records) == 0:
+            return
+        self.count += len(records)
+        for name, column in COLUMN_METRICS.items():
+            values = trip_times(records) if column is None else records[column]
+            self.moments[name].update(values)
+            self.sketches[name].update(values)
+            self.bins[name].update(values)
+        for name, column in COUNT_METRICS.items():
+            self.add_counts(name, np.bincount(records[column]))
+
+    def add_counts(self, name: str, counts: np.ndarray):
+        groups = self.groups[name]
+        if len(counts) > len(groups):
+            groups = np.concatenate((groups, np.zeros(len(counts) - len(groups), dtype=np.int64)))
+        groups[:len(counts)] += counts
+        self.groups[name] = groups
+
+    def merge(self, other):
+        self.count += other.count
+        for name in COLUMN_METRICS:
+            self.moments[name].merge(other.moments[name])
+            self.sketches[name].merge(other.sketches[name])
+            self.bins[name].merge(other.bins[name])
+        for name in COUNT_METRICS:
+            self.add_counts(name, other.groups[name])
+
+    def statistics(self) -> dict:
+        # Same statistics of trip_statistics: mean, variance, min and max are exact, median sketched and mode binned
+        statistics = {}
+        for name in COLUMN_METRICS:
+            moments = self.moments[name]
+            if moments.count == 0:
+                statistics[name] = dict.fromkeys(STATISTICS, np.nan)
+                continue
+            # bin center clamped to the range of the values (a column of zeros has mode 0)
+            median = self.sketches[name].quantile(0.5)
+            mode = min(max(self.bins[name].mode(), moments.min), moments.max)
+            statistics[name] = {
+                "mean": moments.mean, "max": moments.max, "min": moments.min,
+                "median": median, "mode": mode, "var": moments.var(),
+            }
+        for name in COUNT_METRICS:
+            groups = self.groups[name]
+            statistics[name] = describe(groups[groups > 0])
+        return statistics
@@ -0,0 +1,152 @@
+from simulation.results import DTYPE, iter_records
+from metrics import trip_times
+
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import numpy as np
+import os, sys
+
+# Plots of the trips (histograms of the columns of the trip table)
+#
+# The histograms are computed with np.histogram and saved in plots/histograms.npz,
+# then each plot is rendered from its histogram (in a pool of processes) and closed after saving.
+# matplotlib and seaborn are imported only to render, computing and saving the histograms needs only NumPy.
+# A run with only the statistics computes no histograms, plots.py computes them from its result file.
+# The plots can be rendered again from the saved histograms without the trip table:
+#     python3 plots.py SIMULATION_PATH [--plots=NAME,...] [--workers=N]
+
+# name of the plot (plots/NAME.png) -> column of the trip table (None: trip time)
+PLOTS = {
+    "start_time": "Start Time",
+    "unlock_time": "Unlock Time",
+    "lock_time": "Lock Time",
+    "from_station": "From Station",
+    "to_station": "To Station",
+    "vehicle_used": "Vehicle ID",
+    "distance": "Distance",
+    "battery_used": "Battery Used",
+    "total_time": "Total Time",
+    "velocity": "Velocity",
+    "trip_time": None,
+}
+
+BINS = 100
+HISTOGRAMS_FILE = "histograms.npz"
+
+def column_values(table, column: str) -> np.ndarray:
+    return trip_times(table) if column is None else np.asarray(table[column])
+
+def compute_histograms(table, bins: int = BINS) -> dict:
+    # (counts, edges) of each plot from the trip table (structured array or DataFrame)
+    return {name: np.histogram(column_values(table, column), bins=bins) for name, column in PLOTS.items()}
+
+def histograms_from_file(dir_path: str, chunk_size: int = 65536, bins: int = BINS) -> dict:
+    # Same histograms of compute_histograms reading the result file in blocks:
+    # a pass for the range of each column and a pass for the counts, the memory doesn't depend on the number of trips
+    low = dict.fromkeys(PLOTS, np.inf)
+    high = dict.fromkeys(PLOTS, -np.inf)
+    for records in iter_records(dir_path, chunk_size, DTYPE):
+        for name, column in PLOTS.items():
+            values = column_values(records, column)
+            low[name] = min(low[name], values.min())
+            high[name] = max(high[name], values.max())
+
+    # the edges np.histogram would use for the whole column
+    edges = {name: np.histogram_bin_edges(np.array([low[name], high[name]]), bins=bins) for name in PLOTS}
+    counts = {name: np.zeros(bins, dtype=np.int64) for name in PLOTS}
+    for records in iter_records(dir_path, chunk_size, DTYPE):
+        for name, column in PLOTS.items():
+            counts[name] += np.histogram(column_values(records, column), bins=edges[name])[0]
+
+    return {name: (counts[name], edges[name]) for name in PLOTS}
+
+def save_histograms(dir_path: str, histograms: dict):
+    os.makedirs(os.path.join(dir_path, "plots"), exist_ok=True)
+    arrays = {}
+    for name, (counts, edges) in histograms.items():
+        arrays[name + "_counts"] = counts
+        arrays[name + "_edges"] = edges
+    np.savez(os.path.join(dir_path, "plots", HISTOGRAMS_FILE), **arrays)
+
+def load_histograms(dir_path: str) -> dict:
+    # Histograms saved by save_histograms, None if there are none
+    path = os.path.join(dir_path, "plots", HISTOGRAMS_FILE)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as arrays:
+        return {name: (arrays[name + "_counts"], arrays[name + "_edges"]) for name in PLOTS if name + "_counts" in arrays}
+
+def render(name: str, counts: np.ndarray, edges: np.ndarray, path: str):
+    # Draw the histogram of a plot and save it, the figure is closed after saving
+    import matplotlib
+    # headless rendering, also in the workers of a sweep
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    figure = plt.figure()
+    ax = figure.gca()
+    sns.histplot(x=edges[:-1], weights=counts, bins=list(edges), ax=ax)
+    ax.set_xlabel("Trip Time" if PLOTS[name] is None else PLOTS[name])
+    figure.savefig(path)
+    plt.close(figure)
+
+def check_names(names: list) -> list:
+    # Names of the plots (all if None), an exception for an unknown plot
+    names = list(PLOTS) if names is None else names
+    for name in names:
+        if name not in PLOTS:
+            raise Exception(f'Invalid plot {name}')
+    return names
+
+def missing_plots(dir_path: str, names: list = None) -> list:
+    # Plots in names (all if None) not rendered yet in dir_path
+    return [name for name in check_names(names) if not os.path.exists(os.path.join(dir_path, "plots", name + ".png"))]
+
+def render_plots(dir_path: str, histograms: dict, names: list = None, workers: int = None):
+    # Render the plots in names (all if None) in plots/, with a pool of workers processes
+    # (in this process with 1; if None os.cpu_count(), or 1 in a worker process of a sweep, whose CPUs are already busy)
+    names = check_names(names)
+
+    os.makedirs(os.path.join(dir_path, "plots"), exist_ok=True)
+    tasks = [(name, *histograms[name], os.path.join(dir_path, "plots", name + ".png")) for name in names]
+
+    if workers is None:
+        workers = os.cpu_count() if multiprocessing.parent_process() is None else 1
+    workers = min(workers, len(tasks))
+    if workers <= 1:
+        for task in tasks:
+            render(*task)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for future in [executor.submit(render, *task) for task in tasks]:
+            future.result()
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] in ("-h", "--help"):
+        print("Usage: python3 {} SIMULATION_PATH [--plots=NAME,...] [--workers=N]".format(sys.argv[0]))
+        print("\tSIMULATION_PATH\t\tDirectory of a simulation")
+        print("\t--plots=NAME,...\tPlots to render (default all): {}".format(", ".join(PLOTS)))
+        print("\t--workers=N\t\tNumber of plots rendered at the same time")
+        exit()
+
+    dir_path = sys.argv[1]
+    names = None
+    workers = None
+    for arg in sys.argv[2:]:
+        if arg.startswith("--plots="):
+            names = arg.split("=")[1].split(",")
+        elif arg.startswith("--workers="):
+            workers = int(arg.split("=")[1])
+
+    # the saved histograms, computed from the result file if there are none
+    histograms = load_histograms(dir_path)
+    if histograms is None:
+        histograms = histograms_from_file(dir_path)
+        save_histograms(dir_path, histograms)
+
+    render_plots(dir_path, histograms, names, workers)
+
+if __name__ == "__main__":
+    main()
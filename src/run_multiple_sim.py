@@ -1,42 +1,177 @@
-import os, json
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from simulation.utils import load_config
+from setup import simplified_configuration
+from main import run_simulation
+from plots import PLOTS, check_names
+from cache import Cache, LayoutCache
+
+import os, sys, json, copy, shutil, time, contextlib
+
+# Sweep over the simplified configuration: every combination of number of users, charging time and seed
+# The configurations are built in memory (config/*.json are only read) and the simulations run in a pool of processes.
+# Each completed simulation is appended to manifest.jsonl in the results directory,
+# a sweep started again in the same directory skips the simulations already in the manifest.
+
+# station layouts of each worker process, shared by its simulations (the runs of a sweep have the same stations)
+LAYOUT_CACHE = LayoutCache()
+
+def build_runs(simplified_config: dict, user_number: list, charging_times: list, seeds: list) -> list:
+    # Simplified configuration of each simulation of the sweep
+    runs = []
+    for n in user_number:
+        for t in charging_times:
+            for i, seed in enumerate(seeds):
+                config = copy.deepcopy(simplified_config)
+                config["users"]["number"] = n
+                config["stations"]["recharge_time"] = t
+
+                runs.append({
+                    "run": os.path.join(f"user_{n}", f"time_{t}", f"simulation_{i}"),
+                    "users": n,
+                    "recharge_time": t,
+                    "seed": seed,
+                    "config": config
+                })
+    return runs
+
+def load_manifest(manifest_path: str) -> set:
+    # Simulations already completed (the last line can be truncated by a crash)
+    completed = set()
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r") as f:
+            for line in f:
+                try:
+                    completed.add(json.loads(line)["run"])
+                except (json.decoder.JSONDecodeError, KeyError):
+                    continue
+    return completed
+
+def run_sweep_simulation(run: dict, vehicle_data: dict, base_path: str, cache: Cache = None, plots: list = None) -> dict:
+    # Run a simulation of the sweep, executed in a worker process
+    # Only the statistics by default (plots empty): no plots nor histograms, plots.py can render them later from the result file
+    path = os.path.join(base_path, run["run"])
+
+    # files of a simulation interrupted by a crash
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.makedirs(path)
+
+    # use simplified configuration as description
+    with open(os.path.join(path, "description.txt"), "w") as f:
+        json.dump(run["config"], f, indent=4)
+
+    config_data, vehicle_data = simplified_configuration(run["config"], vehicle_data)
+
+    # the output of the simulation goes to a file instead of mixing with the one of the other workers
+    start = time.perf_counter()
+    with open(os.path.join(path, "output.txt"), "w") as f, contextlib.redirect_stdout(f):
+        summary = run_simulation(config_data, vehicle_data, run["seed"], path, cache=cache, plots=[] if plots is None else plots, layout_cache=LAYOUT_CACHE)
+    summary["elapsed"] = time.perf_counter() - start
+
+    return summary
 
 def main():
-    with open(os.path.join(os.path.dirname(__file__), "../config/simplified.json"), "r") as f:
-        simplified_config = json.load(f)
+    # path to the directory where the results will be saved
+    base_path = os.path.join(os.path.dirname(__file__), "../../simulations")
+
+    # number of simulations running at the same time
+    workers = os.cpu_count()
 
     charging_times = [i for i in range(1, 100)]
     user_number = [25000, 30000, 35000]
     seeds = [11297, 8850, 22096, 31782, 55605]
 
+    # cache of the simulation runs, shared by the workers
+    cache = None
+
+    # plots rendered by each simulation, None means none (only the statistics)
+    plots = None
+
+    for arg in sys.argv[1:]:
+        if arg == "-h" or arg == "--help":
+            print("Usage: python3 {} [--workers=N] [-apath=PATH|-rpath=PATH] [--users=N,...] [--times=T,...] [--seeds=S,...] [--cache[=DIR]] [--plots[=NAME,...]]".format(sys.argv[0]))
+            print("\t--workers=N\t\tNumber of simulations running at the same time (default: number of CPUs)")
+            print("\t-apath=PATH\t\tAbsolute path of the results directory")
+            print("\t-rpath=PATH\t\tPath of the results directory relative to this file")
+            print("\t--users=N,...\t\tNumbers of users of the sweep")
+            print("\t--times=T,...\t\tCharging times of the sweep")
+            print("\t--seeds=S,...\t\tSeeds of the sweep")
+            print("\t--cache[=DIR]\t\tReuse the results of the runs already in the cache")
+            print("\t--plots[=NAME,...]\tRender the plots (all or the given ones) of each simulation, by default only the statistics")
+            exit()
+
+        elif arg.startswith("--workers="):
+            workers = int(arg.split("=")[1])
+
+        elif arg.startswith("-apath=") or arg.startswith("--absolute_path="):
+            base_path = arg.split("=")[1]
+
+        elif arg.startswith("-rpath=") or arg.startswith("--relative_path="):
+            base_path = os.path.join(os.path.dirname(__file__), arg.split("=")[1])
+
+        elif arg.startswith("--users="):
+            user_number = [int(n) for n in arg.split("=")[1].split(",")]
+
+        elif arg.startswith("--times="):
+            charging_times = [int(t) for t in arg.split("=")[1].split(",")]
+
+        elif arg.startswith("--seeds="):
+            seeds = [int(s) for s in arg.split("=")[1].split(",")]
+
+        elif arg == "--cache":
+            cache = Cache()
+
+        elif arg.startswith("--cache="):
+            cache = Cache(arg.split("=")[1])
+
+        elif arg == "--plots":
+            plots = list(PLOTS)
+
+        elif arg.startswith("--plots="):
+            plots = check_names(arg.split("=")[1].split(","))
+
+    simplified_config = load_config(os.path.join(os.path.dirname(__file__), "../config/simplified.json"))
+    vehicle_data = load_config(os.path.join(os.path.dirname(__file__), "../config/vehicle.json"))
+
+    os.makedirs(base_path, exist_ok=True)
+
     # save seeds to file
-    with open(os.path.join(os.path.dirname(__file__), "../../simulations/seeds.txt"), "w") as f:
+    with open(os.path.join(base_path, "seeds.txt"), "w") as f:
         for seed in seeds:
             f.write(str(seed) + "\n")
 
-    print(f"running {len(user_number)*len(charging_times)*len(seeds)} simulations")
+    runs = build_runs(simplified_config, user_number, charging_times, seeds)
 
-    base_path = os.path.join(os.path.dirname(__file__), "../../simulations")
+    manifest_path = os.path.join(base_path, "manifest.jsonl")
+    completed = load_manifest(manifest_path)
+    to_run = [r for r in runs if r["run"] not in completed]
 
-    for n in user_number:
-        simplified_config["users"]["number"] = n
-        os.makedirs(os.path.join(base_path, f"user_{n}"))
-        
-        for t in charging_times:
-            simplified_config["stations"]["recharge_time"] = t
-            path = os.path.join(base_path, f"user_{n}", f"time_{t}")
-            os.makedirs(path)
+    print(f"running {len(to_run)} simulations ({len(runs) - len(to_run)} already completed) with {workers} workers")
 
-            print("Running simulations with charging time {}\n".format(t))
+    failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor, open(manifest_path, "a") as manifest:
+        futures = {executor.submit(run_sweep_simulation, r, vehicle_data, base_path, cache, plots): r for r in to_run}
 
-            with open(os.path.join(os.path.dirname(__file__), "../config/simplified.json"), "w") as f:
-                    json.dump(simplified_config, f, indent=4)            
+        for done, future in enumerate(as_completed(futures), 1):
+            r = futures[future]
+            try:
+                summary = future.result()
+            except Exception as e:
+                failed += 1
+                print("[{}/{}] {} failed: {!r}".format(done, len(to_run), r["run"], e))
+                continue
 
-            for i, seed in enumerate(seeds):
-                print("Running simulation {}\n".format(i))
-                os.system("python3 {} -s --seed={} -rpath={}".format(os.path.join(os.path.dirname(__file__), "main.py"), seed, path))
-                print()
+            # the run is recorded only when all its files are written
+            print(json.dumps({"run": r["run"], "users": r["users"], "recharge_time": r["recharge_time"], "seed": r["seed"], "summary": summary}), file=manifest, flush=True)
+
+            print("[{}/{}] {}: {} trips, average total time {:.3f}, {:.1f}s".format(
+                done, len(to_run), r["run"], summary["completed_trips"], summary["avg_total_time"], summary["elapsed"]))
 
-    print("Done!")
+    if failed:
+        print(f"{failed} simulations failed, run the sweep again to retry them")
+    else:
+        print("Done!")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
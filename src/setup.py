@@ -1,19 +1,177 @@
 from environment.env import Environment
-from environment.process import Process
+from environment.scheduler import Scheduler
+from environment.event import Event
 
 from simulation.user import User
-from simulation.station import Station
-from simulation.utils import find_index_nearest_k_points, find_index_at_distance
+from simulation.station import Station, AnalyticStation
+from simulation.demand import ODGenerator, POPULATION
+from simulation.results import ResultCollector
+from simulation.fleet import Fleet
+
+from simulation.utils import StationIndex
+from cache import DemandCache, LayoutCache
 
 import numpy as np
-import os, random
+import os, random, copy
+
+def load_scheduler(config_data: dict, scheduler_type: str = None) -> Scheduler:
+    # Create the event queue specified in the configuration file (HeapQueue if not specified)
+    # scheduler_type overrides the type in the configuration file
+    scheduler_config = config_data.get("scheduler", {})
+    if scheduler_type is None:
+        scheduler_type = scheduler_config.get("type", "HeapQueue")
+
+    try:
+        scheduler = getattr(__import__("environment.scheduler", fromlist=[scheduler_type]), scheduler_type)
+    except AttributeError:
+        raise Exception(f'Invalid scheduler type {scheduler_type}')
+
+    return scheduler(scheduler_config.get("parameters", {}) if scheduler_type == scheduler_config.get("type") else {})
+
+def simplified_configuration(simplified_config: dict, vehicle_data: dict):
+    # Build the configurations (simulation.json, vehicle.json) of the simplified configuration (simplified.json)
+    # Returns new dictionaries, vehicle_data and the configuration files aren't modified
+    vehicle_data = copy.deepcopy(vehicle_data)
+    vehicle_data["Scooter"]["BATTERY_CAPACITY"] = 1000
+    vehicle_data["Scooter"]["ENERGY_CONSUMPTION"] = 1000/simplified_config["vehicle"]["autonomy"]
+
+    radice = simplified_config["stations"]["number"]**0.5
+    if radice - int(radice) < 0.5:
+        radice = int(radice)
+    else:
+        radice = int(radice) + 1
+
+    storage = {"capacity": simplified_config["stations"]["capacity"]} if simplified_config["stations"]["type"] == "LIFO" else {"stack1_size": simplified_config["stations"]["capacity"]//2,"stack2_size": simplified_config["stations"]["capacity"]//2}
+
+    users = simplified_config["users"]["number"]
+    linear = [
+        [0, 60, 245/10000*users],
+        [60, 90, 139/10000*users],
+        [90, 120, 155/10000*users],
+        [120, 150, 171/10000*users],
+        [150, 180, 188/10000*users],
+        [180, 1080, 6122/10000*users]
+    ]
+    normal = [
+        [60, 180, 857/10000*users],
+        [420, 540, 286/10000*users],
+        [720, 960, 1837/10000*users]
+    ]
+
+    config_data = {
+        "station": {
+            "charge_per_time": 1000/simplified_config["stations"]["recharge_time"],
+            "max_concurrent_charging": simplified_config["stations"]["max_simultaneous_recharge"],
+
+            "storage":{
+                "type": simplified_config["stations"]["type"],
+                "parameters": storage
+            },
+
+            "deployment": {
+                "type": "grid_cells",
+                "parameters": {
+                    "rows": radice,
+                    "columns": radice,
+                    "width": simplified_config["stations"]["distance"],
+                    "min_distance": simplified_config["stations"]["min_distance"]
+                }
+            }
+        },
+
+        "vehicles": {
+            "type": ["Scooter"],
+
+            "deployment": {
+                "type": "uniform",
+                "parameters": {
+                    "vehicles_per_station": simplified_config["stations"]["vehicles_per_station"]
+                }
+            }
+        },
+
+        "users": {
+            "linear": linear,
+            "normal": normal,
+            "mean_distance": simplified_config["users"]["average_distance"],
+            "max_distance": simplified_config["users"]["max_distance"],
+            "min_distance": simplified_config["users"]["min_distance"],
+            "mean_velocity": simplified_config["vehicle"]["average_speed"],
+            "max_velocity": simplified_config["vehicle"]["max_speed"],
+            "min_velocity": simplified_config["vehicle"]["min_speed"]
+        },
+
+        "no_degeneration": simplified_config["no_degeneration"],
+        "v_per_station": simplified_config["stations"]["vehicles_per_station"],
+        "station_capacity": simplified_config["stations"]["capacity"],
+        "tries": 5000,
+        "redistribution": users//10,
+
+        "run_time": simplified_config["run_time"]
+    }
+
+    return config_data, vehicle_data
+
+def generate_population(config_data: dict, positions: list, v: np.ndarray, v_max: np.ndarray, index: StationIndex = None, verbose: bool = True) -> np.ndarray:
+    # Generate the users: start time, distance, velocity, starting and ending station of each user (POPULATION records)
+    # v and v_max (vehicles and capacity of each station) are used only with no_degeneration
+    # index: spatial index of the positions, built by the ODGenerator if None
+    # verbose: print the warnings of the generation
+    user_start_times = []
+    for start, end, number in config_data["users"]["linear"]:
+        user_start_times.extend(list(np.random.uniform(start, end, int(number))))
+
+    for start, end, number in config_data["users"]["normal"]:
+        for sample in np.around(np.random.normal(0, 1, int(number)), decimals=5):
+            user_start_times.append(start + ((sample + 3)/3)*(end-start))
+    user_start_times.sort()
+
+    # Generate an array of distances with a normal distribution
+    distance = np.random.normal(0, 1, len(user_start_times))/3
+    distance = np.where(distance < -3.3, -3.3, distance)
+    distance = np.where(distance > 3.3, 3.3, distance)
+    distance /= 3.3
+    distance = np.where(distance < 0,
+                        distance * (config_data["users"]["mean_distance"] - config_data["users"]["min_distance"]) + config_data["users"]["mean_distance"],
+                        distance * (config_data["users"]["max_distance"] - config_data["users"]["mean_distance"]) + config_data["users"]["mean_distance"]) 
 
-def setup_simulation(env: Environment, config_data: dict, seed: int):
+    # Generate an array of velocities with a normal distribution
+    velocity = np.random.normal(0, 1, len(user_start_times))
+    velocity = np.where(velocity < -3.3, -3.3, velocity)
+    velocity = np.where(velocity > 3.3, 3.3, velocity)
+    velocity /= 3.3
+    velocity = np.where(velocity < 0,
+                        velocity * (config_data["users"]["mean_velocity"] - config_data["users"]["min_velocity"]) + config_data["users"]["mean_velocity"],
+                        velocity * (config_data["users"]["max_velocity"] - config_data["users"]["mean_velocity"]) + config_data["users"]["mean_velocity"])
+    
+    # Generate starting and ending stations for each user
+    if(config_data["no_degeneration"]):
+        od_generator = ODGenerator(positions, distance, config_data, v.copy(), v_max, index, verbose)
+    else:
+        od_generator = ODGenerator(positions, distance, config_data, index=index, verbose=verbose)
+
+    origins, destinations = od_generator.generate(len(user_start_times), config_data.get("od_batch_size", 0))
+
+    population = np.empty(len(user_start_times), dtype=POPULATION)
+    population["start_time"] = user_start_times
+    population["distance"] = distance
+    population["velocity"] = velocity
+    population["origin"] = origins
+    population["destination"] = destinations
+    return population
+
+def setup_simulation(env: Environment, config_data: dict, seed: int, results: ResultCollector, vehicle_data: dict = None, demand_cache: DemandCache = None, layout_cache: LayoutCache = None, verbose: bool = True):
+    # vehicle_data: content of vehicle.json, if None it is read from config/vehicle.json
+    # demand_cache: cache of the generated users, None to always generate them
+    # layout_cache: station positions kept in memory by a resident process, None to always generate them
+    # verbose: print the progress of the setup
     # set seed
     random.seed(seed)
     np.random.seed(seed)
 
-    print("Loading configuration...", end=" ")
+    progress = print if verbose else lambda *args, **kwargs: None
+
+    progress("Loading configuration...", end=" ")
     # caricamento dinamico funzioni e moduli specificati nel file di configurazione
     try:
         # caricamento funzione di generazione posizioni stazioni
@@ -35,27 +193,44 @@ def setup_simulation(env: Environment, config_data: dict, seed: int):
         for v in config_data["vehicles"]["type"]:
             cls = getattr(vehicle, v)
             vehicle_cls.append(cls)
-            cls.load_config(os.path.join(os.path.dirname(__file__),"../config/vehicle.json"))
+            if vehicle_data is None:
+                cls.load_config(os.path.join(os.path.dirname(__file__),"../config/vehicle.json"))
+            else:
+                cls.configure(vehicle_data)
+
+        # con il backend "fleet" lo stato dei veicoli è memorizzato in array NumPy (see simulation.fleet)
+        if config_data["vehicles"].get("backend", "objects") == "fleet":
+            fleet = Fleet()
+            vehicle_cls = [fleet.vehicle_class(cls) for cls in vehicle_cls]
+        elif config_data["vehicles"].get("backend", "objects") != "objects":
+            raise KeyError("backend")
+
+        # caricamento modello di ricarica delle stazioni
+        station_cls = {"process": Station, "analytic": AnalyticStation}[config_data["station"].get("charging", "process")]
 
         # caricamento funzione di deploy veicoli
         deploy_vehicles = getattr(__import__("simulation.vehicle_deployment", fromlist=[config_data["vehicles"]["deployment"]["type"]]),
                                   config_data["vehicles"]["deployment"]["type"])
 
-    except AttributeError:
+    except (AttributeError, KeyError):
         raise Exception(f'Invalid configuration file')
     except Exception as e:
         raise e
 
-    print("loaded", end="\n\t")
+    progress("loaded", end="\n\t")
 
 
-    print("Generating stations...", end=" ")
+    progress("Generating stations...", end=" ")
     # generazione posizioni stazioni
-    positions = generate_station_positions(config_data["station"]["deployment"]["parameters"], seed)
+    index = None
+    if layout_cache is not None:
+        positions, index = layout_cache.layout(generate_station_positions, config_data["station"]["deployment"], seed)
+    else:
+        positions = generate_station_positions(config_data["station"]["deployment"]["parameters"], seed)
 
     # creazione stazioni
     stations = [
-        Station(
+        station_cls(
             env = env,
             station_id = i,
             position = position, 
@@ -66,165 +241,53 @@ def setup_simulation(env: Environment, config_data: dict, seed: int):
         for i, position in enumerate(positions)
         ]
 
-    print("generated", end="\n\t")
+    progress("generated", end="\n\t")
 
 
-    print("Deploying vehicles...", end=" ")
+    progress("Deploying vehicles...", end=" ")
     # creazione e positionamento veicoli
     deploy_vehicles(stations, vehicle_cls, config_data["vehicles"]["deployment"]["parameters"])
     
-    print("deployed", end="\n\t")
+    progress("deployed", end="\n\t")
 
 
-    print("Generating users...", end=" ")
+    progress("Generating users...", end=" ")
     # inizializzazione utenti
 
-    # fornisce accesso alla variabile env all'interno della classe User
-    User.env = env
-
-    user_start_times = []
-    for start, end, number in config_data["users"]["linear"]:
-        user_start_times.extend(list(np.random.uniform(start, end, int(number))))
-
-    for start, end, number in config_data["users"]["normal"]:
-        for sample in np.around(np.random.normal(0, 1, int(number)), decimals=5):
-            user_start_times.append(start + ((sample + 3)/3)*(end-start))
-    user_start_times.sort()
-
-    # Generate an array of distances with a normal distribution
-    distance = np.random.normal(0, 1, len(user_start_times))/3
-    distance = np.where(distance < -3.3, -3.3, distance)
-    distance = np.where(distance > 3.3, 3.3, distance)
-    distance /= 3.3
-    distance = np.where(distance < 0,
-                        distance * (config_data["users"]["mean_distance"] - config_data["users"]["min_distance"]) + config_data["users"]["mean_distance"],
-                        distance * (config_data["users"]["max_distance"] - config_data["users"]["mean_distance"]) + config_data["users"]["mean_distance"]) 
-
-    # Generate an array of velocities with a normal distribution
-    velocity = np.random.normal(0, 1, len(user_start_times))
-    velocity = np.where(velocity < -3.3, -3.3, velocity)
-    velocity = np.where(velocity > 3.3, 3.3, velocity)
-    velocity /= 3.3
-    velocity = np.where(velocity < 0,
-                        velocity * (config_data["users"]["mean_velocity"] - config_data["users"]["min_velocity"]) + config_data["users"]["mean_velocity"],
-                        velocity * (config_data["users"]["max_velocity"] - config_data["users"]["mean_velocity"]) + config_data["users"]["mean_velocity"])
-    
-    users = []
-    max_distance = config_data["users"]["max_distance"]
-    min_distance = config_data["users"]["min_distance"]
-    
-    # Generate starting and ending stations for each user
-    if(config_data["no_degeneration"]):
-        max_tries = config_data["tries"]
-        user_to_redistribute = config_data["redistribution"] - 1 # -1 because the first user is redistributed before the redistribution loop
-        
-        v = np.array([station.vehicles.count() for station in stations])
-        v_max = np.array([station.vehicles.max_capacity() for station in stations])
-        
-        redistribution = 0
-        for i in range(len(user_start_times)):
-            if redistribution > 0:
-                # Find the maximum relative value
-                v_perc = v/v_max
-                max_value = np.max(v_perc)
-
-                # Find the indices of all occurrences of the maximum value
-                max_indices = np.where(v == max_value)[0]
-                p = np.random.choice(max_indices)
-
-                # find the point between min_distance and max_distance from the station p
-                indexes = find_index_at_distance(center = positions[p], min_radius = distance[i], max_radius = distance[i], points = positions)
-                sorted_indexes = sorted(indexes, key=lambda k: v[k])
-
-                for index in sorted_indexes:
-                    if p == index:
-                        continue
-                    else:
-                        a = index
-                        break
-                else:
-                    raise Exception("No suitable point found")
-
-                v[p] -= 1
-                v[a] += 1
-                users.append([User(i, stations[p], stations[a], velocity[i]), user_start_times[i]])
-                redistribution -= 1
-            else:
-                tries = 0
-                while True:
-                    if tries > max_tries:
-                        print("#############################################")
-                        print("#############################################")
-                        print("###### WARNING STARTING REDISTRIBUTION ######")
-                        print("#############################################")
-                        print("#############################################")
-
-                        # prossimi x utenti andranno da stazzioni piene a stazioni vuote
-                        redistribution = user_to_redistribute
-
-                        # Find the maximum relative value
-                        v_perc = v/v_max
-                        max_value = np.max(v_perc)
-
-                        # Find the indices of all occurrences of the maximum value
-                        max_indices = np.where(v == max_value)[0]
-                        p = np.random.choice(max_indices)
-
-                        # find the point between min_distance and max_distance from the station p
-                        indexes = find_index_at_distance(center = positions[p], min_radius = distance[i], max_radius = distance[i], points = positions)
-                        sorted_indexes = sorted(indexes, key=lambda k: v[k])
-
-                        for index in sorted_indexes:
-                            if p == index:
-                                continue
-                            else:
-                                a = index
-                                break
-                        else:
-                            raise Exception("No suitable point found")
-
-                    else:
-                        p = random.randint(0,len(stations)-1)
-                        while v[p] <= 0:
-                            p = random.randint(0,len(stations)-1)
-
-                        indexes = find_index_nearest_k_points(center = positions[p], radius = distance[i], points = positions, k = 5)
-                        
-                        for index in indexes:
-                            if p == index or v[index] == v_max[index] or stations[p].distance(stations[index]) > max_distance or stations[p].distance(stations[index]) < min_distance:
-                                continue
-                            else:
-                                a = index
-                                break
-                        else:
-                            tries += 1
-                            continue
-
-                    v[p] -= 1
-                    v[a] += 1
-                    users.append([User(i, stations[p], stations[a], velocity[i]), user_start_times[i]])
-                    break
-    else:
-        for i in range(len(user_start_times)):
-            p = random.randint(0,len(stations)-1)
-
-            indexes = find_index_nearest_k_points(center = positions[p], radius = distance[i], points = positions, k = 5)
-
-            for index in indexes:
-                if p == index or stations[p].distance(stations[index]) > max_distance or stations[p].distance(stations[index]) < min_distance:
-                    continue
-                else:
-                    a = index
-                    break
-            else:
-                raise Exception("No suitable point found")
-
-            users.append([User(i, stations[p], stations[a], velocity[i]), user_start_times[i]])
-       
-    print("generated")
-    
-    # creazione processi
-    for user, start_time in users:
-        p = Process(start_time, user.run())
-        user.process = p
-        env.add_process(p)
\ No newline at end of file
+    # classe degli utenti di questa simulazione: fornisce l'accesso a env
+    # e alla raccolta dei risultati dei viaggi completati
+    user_cls = User.bind(env, results)
+
+    # vehicles and capacity of each station at the start of the simulation
+    v = np.array([station.vehicles.count() for station in stations])
+    v_max = np.array([station.vehicles.max_capacity() for station in stations])
+
+    # the users depend only on the configuration of the users and on the stations, not on the charging
+    # so the same population can be reused by simulations that differ only in the charging
+    population = None
+    if demand_cache is not None:
+        key = demand_cache.key(config_data, seed, v, v_max)
+        population = demand_cache.load(key)
+
+    if population is None:
+        population = generate_population(config_data, positions, v, v_max, index, verbose)
+        if demand_cache is not None:
+            demand_cache.store(key, population)
+
+    progress("generated")
+
+    # gli utenti vengono creati solo quando partono
+    env.add_source(user_arrivals(population, stations, user_cls))
+
+    return stations
+
+def user_arrivals(population: np.ndarray, stations: list, user_cls: type = User, chunk_size: int = 65536):
+    # Create the start event of each user of the population (of class user_cls, see User.bind), in order of start time
+    # The records are converted to Python values in chunks of chunk_size, each user is created when the previous one starts
+    for start in range(0, len(population), chunk_size):
+        chunk = population[start:start + chunk_size]
+        start_times = chunk["start_time"].tolist()
+        velocity = chunk["velocity"].tolist()
+        for j, (p, a) in enumerate(zip(chunk["origin"].tolist(), chunk["destination"].tolist())):
+            user = user_cls(start + j, stations[p], stations[a], velocity[j])
+            yield Event(start_times[j], user.start)
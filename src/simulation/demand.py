@@ -0,0 +1,301 @@
+from simulation.utils import StationIndex
+
+import numpy as np
+import random, bisect
+
+# Generated users (population), one record for each user in order of start time
+POPULATION = np.dtype([
+    ("start_time", np.float64),
+    ("distance", np.float64),
+    ("velocity", np.float64),
+    ("origin", np.int64),
+    ("destination", np.int64),
+])
+
+class FillIndex:
+    # Bucket queue of the stations by fill ratio (v/v_max), used by the redistribution
+    # Each bucket contains the stations with the same ratio in increasing order, the ratios are kept sorted.
+    # update() moves a station between buckets after v changes, in O(log R + B)
+    # (R distinct ratios, B stations in the bucket) instead of recomputing v/v_max for all the stations
+
+    def __init__(self, v: np.ndarray, v_max: np.ndarray):
+        self.v = v
+        self.v_max = v_max
+
+        self.ratio = (v / v_max).tolist()
+        self.buckets = {}
+        for station, ratio in enumerate(self.ratio):
+            self.buckets.setdefault(ratio, []).append(station)
+        self.keys = sorted(self.buckets)
+
+    def update(self, station: int):
+        # Move the station to the bucket of its current ratio
+        old = self.ratio[station]
+        new = float(self.v[station] / self.v_max[station])
+        if new == old:
+            return
+
+        bucket = self.buckets[old]
+        del bucket[bisect.bisect_left(bucket, station)]
+        if not bucket:
+            del self.buckets[old]
+            del self.keys[bisect.bisect_left(self.keys, old)]
+
+        if new not in self.buckets:
+            self.buckets[new] = []
+            bisect.insort(self.keys, new)
+        bisect.insort(self.buckets[new], station)
+
+        self.ratio[station] = new
+
+    def fullest(self) -> list:
+        # Stations with the maximum ratio, in increasing order
+        return self.buckets[self.keys[-1]]
+
+    def emptiest(self, allowed: set):
+        # Station with the minimum ratio among the allowed ones (the first one in case of ties)
+        for key in self.keys:
+            for station in self.buckets[key]:
+                if station in allowed:
+                    return station
+        return None
+
+class ODGenerator:
+    # Generates the starting and ending station (origin/destination pair) of each user
+    # Users are generated in order of start time, the distance of each trip is given
+    #
+    # With no_degeneration the number of vehicles of each station (v) is updated as if the trips happened in order,
+    # an origin must have a vehicle and a destination must have a free slot.
+    # After tries failed attempts the next redistribution users go from the fullest stations to the emptiest ones
+    # (by fill ratio v/v_max, see FillIndex).
+
+    # maximum number of distances of the sorted rows computed at once by batch (16M: 192 MB with their indexes)
+    ROW_BLOCK = 1 << 24
+
+    def __init__(self, positions: list, distance: np.ndarray, config_data: dict, v: np.ndarray = None, v_max: np.ndarray = None, index: StationIndex = None, verbose: bool = True):
+        # index: spatial index of the positions, shared by the simulations with the same stations (see cache.LayoutCache)
+        # verbose: print a warning when the redistribution starts
+        self.verbose = verbose
+        self.positions = positions
+        self.distance = distance
+        self.index = StationIndex(positions) if index is None else index
+
+        self.max_distance = config_data["users"]["max_distance"]
+        self.min_distance = config_data["users"]["min_distance"]
+
+        self.v = v
+        self.v_max = v_max
+
+        # with no_degeneration (v given) tries and redistribution are required
+        if v is not None:
+            self.max_tries = config_data["tries"]
+            self.user_to_redistribute = config_data["redistribution"] - 1 # -1 because the first user is redistributed before the redistribution loop
+
+        # number of users still to redistribute and index of the stations by fill ratio used meanwhile
+        self.redistribution = 0
+        self.fill = None
+
+    def station_distance(self, p: int, a: int):
+        # same as Station.distance
+        return ((self.positions[p][0] - self.positions[a][0])**2 + (self.positions[p][1] - self.positions[a][1])**2)**0.5
+
+    def free_pair(self, i: int):
+        # Origin/destination of user i without no_degeneration
+        p = random.randint(0,len(self.positions)-1)
+
+        indexes = self.index.nearest_k(center = p, radius = self.distance[i], k = 5)
+
+        for index in indexes:
+            if p == index or self.station_distance(p, index) > self.max_distance or self.station_distance(p, index) < self.min_distance:
+                continue
+            else:
+                a = index
+                break
+        else:
+            raise Exception("No suitable point found")
+
+        return p, a
+
+    def redistribute(self, i: int):
+        # Origin/destination of user i from one of the fullest stations
+        # to the emptiest station between min_distance and max_distance from it
+        p = np.random.choice(self.fill.fullest())
+
+        allowed = set(self.index.at_distance(center = p, min_radius = self.min_distance, max_radius = self.max_distance))
+        allowed.discard(p)
+
+        a = self.fill.emptiest(allowed)
+        if a is None:
+            raise Exception("No suitable point found")
+
+        return p, a
+
+    def next_pair(self, i: int):
+        # Origin/destination of user i with no_degeneration, updates the number of vehicles of the stations
+        v, v_max = self.v, self.v_max
+
+        if self.redistribution > 0:
+            p, a = self.redistribute(i)
+            self.redistribution -= 1
+            if self.redistribution == 0:
+                # the index isn't updated by the generation of the other users
+                self.fill = None
+        else:
+            tries = 0
+            while True:
+                if tries > self.max_tries:
+                    if self.verbose:
+                        print("#############################################")
+                        print("#############################################")
+                        print("###### WARNING STARTING REDISTRIBUTION ######")
+                        print("#############################################")
+                        print("#############################################")
+
+                    # prossimi x utenti andranno da stazzioni piene a stazioni vuote
+                    self.redistribution = self.user_to_redistribute
+                    self.fill = FillIndex(v, v_max)
+
+                    p, a = self.redistribute(i)
+                    if self.redistribution == 0:
+                        self.fill = None
+                    break
+                else:
+                    p = random.randint(0,len(self.positions)-1)
+                    while v[p] <= 0:
+                        p = random.randint(0,len(self.positions)-1)
+
+                    indexes = self.index.nearest_k(center = p, radius = self.distance[i], k = 5)
+
+                    for index in indexes:
+                        if p == index or v[index] == v_max[index] or self.station_distance(p, index) > self.max_distance or self.station_distance(p, index) < self.min_distance:
+                            continue
+                        else:
+                            a = index
+                            break
+                    else:
+                        tries += 1
+                        continue
+                    break
+
+        v[p] -= 1
+        v[a] += 1
+        if self.fill is not None:
+            self.fill.update(p)
+            self.fill.update(a)
+        return p, a
+
+    def generate(self, n: int, batch_size: int = 0):
+        # Origin and destination arrays of n users
+        # with no_degeneration and batch_size > 0 the pairs are generated in blocks of users (see batch)
+        origins = np.empty(n, dtype=np.int64)
+        destinations = np.empty(n, dtype=np.int64)
+
+        if self.v is None:
+            for i in range(n):
+                origins[i], destinations[i] = self.free_pair(i)
+        elif batch_size <= 0:
+            for i in range(n):
+                origins[i], destinations[i] = self.next_pair(i)
+        else:
+            self.batch(origins, destinations, batch_size)
+
+        return origins, destinations
+
+    def batch(self, origins: np.ndarray, destinations: np.ndarray, batch_size: int, k: int = 5, attempts: int = 4):
+        # Generation with no_degeneration for blocks of batch_size users
+        # The expensive part is vectorized for the whole block, for a few attempts per user:
+        # - the origins are drawn among the stations with a vehicle at the start of the block
+        # - the k stations whose distance from the origin is closest to the trip distance are found
+        #   with a binary search on the sorted distances of the sampled origins, computed for blocks of origins,
+        #   and the ones that are the origin or don't respect min_distance/max_distance are discarded
+        # The number of vehicles of the stations depends on the order of the users, so a single pass over the block
+        # takes the first attempt whose origin still has a vehicle and the first candidate destination that isn't full.
+        # Only the users without a feasible pair in any attempt are generated by next_pair (with its retries and redistribution).
+        v, v_max = self.v, self.v_max
+        n = len(origins)
+        stations = len(self.positions)
+
+        offsets = np.arange(-k, k)
+        # the sorted rows of the origins are computed for blocks of at most ROW_BLOCK distances
+        origins_per_block = max(1, self.ROW_BLOCK // stations)
+
+        for start in range(0, n, batch_size):
+            end = min(n, start + batch_size)
+            b = end - start
+            radius = np.repeat(self.distance[start:end], attempts)
+
+            # origins among the stations with at least one vehicle
+            available = np.flatnonzero(v > 0)
+            p = available[np.random.randint(len(available), size=b * attempts)]
+
+            candidates = np.empty((b * attempts, k), dtype=np.int64)
+            candidate_distance = np.empty((b * attempts, k))
+            inside = np.empty((b * attempts, k), dtype=bool)
+
+            # only the rows of the sampled origins are needed
+            sampled, row_of = np.unique(p, return_inverse=True)
+            for first in range(0, len(sampled), origins_per_block):
+                sorted_distances, order = self.index.sorted_rows(sampled[first:first + origins_per_block])
+                selected = np.flatnonzero((row_of >= first) & (row_of < first + origins_per_block))
+                rows = row_of[selected] - first
+                r = radius[selected]
+
+                # binary search of the trip distance in the sorted row of each origin
+                lo = np.zeros(len(selected), dtype=np.int64)
+                hi = np.full(len(selected), stations, dtype=np.int64)
+                for _ in range(stations.bit_length()):
+                    mid = (lo + hi) // 2
+                    go = sorted_distances[rows, np.minimum(mid, stations - 1)] < r
+                    active = lo < hi
+                    lo = np.where(active & go, mid + 1, lo)
+                    hi = np.where(active & ~go, mid, hi)
+
+                # k closest distances to the trip distance, around its position in the row
+                window = lo[:, None] + offsets
+                in_row = (window >= 0) & (window < stations)
+                window = np.clip(window, 0, stations - 1)
+                distance = sorted_distances[rows[:, None], window]
+                keys = np.where(in_row, np.abs(distance - r[:, None]), np.inf)
+                nearest = np.argsort(keys, axis=1, kind="stable")[:, :k]
+
+                candidates[selected] = order[rows[:, None], np.take_along_axis(window, nearest, axis=1)]
+                candidate_distance[selected] = np.take_along_axis(distance, nearest, axis=1)
+                inside[selected] = np.take_along_axis(in_row, nearest, axis=1)
+
+            valid = (inside
+                     & (candidates != p[:, None])
+                     & (candidate_distance <= self.max_distance)
+                     & (candidate_distance >= self.min_distance))
+
+            # candidates that fail the static checks are replaced by -1
+            candidates = np.where(valid, candidates, -1).tolist()
+            p = p.tolist()
+
+            # the pass works on lists, v is synchronized around the calls to next_pair
+            counts = v.tolist()
+            limits = v_max.tolist()
+            for j in range(b):
+                i = start + j
+                found = False
+                if self.redistribution == 0:
+                    for attempt in range(j * attempts, (j + 1) * attempts):
+                        origin = p[attempt]
+                        if counts[origin] <= 0:
+                            continue
+                        for a in candidates[attempt]:
+                            if a >= 0 and counts[a] < limits[a]:
+                                found = True
+                                break
+                        if found:
+                            counts[origin] -= 1
+                            counts[a] += 1
+                            origins[i] = origin
+                            destinations[i] = a
+                            break
+
+                if not found:
+                    v[:] = counts
+                    origins[i], destinations[i] = self.next_pair(i)
+                    counts = v.tolist()
+
+            v[:] = counts
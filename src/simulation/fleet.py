@@ -0,0 +1,83 @@
+from simulation.vehicle import Vehicle
+
+import numpy as np
+
+class Fleet:
+    # Struct of arrays of the vehicles: the state of the vehicle with id i is at index i of the arrays
+    # (battery, type, charge start time and rate), the vehicle objects only hold their id.
+    # Used with "backend": "fleet" in the vehicles configuration, see vehicle_class.
+
+    def __init__(self, size: int = 1024):
+        self.types = []
+        self.battery = np.ones(size, dtype=np.float64)
+        self.type = np.zeros(size, dtype=np.int8)
+        self.charge_start_time = np.full(size, np.nan, dtype=np.float64)
+        self.charge_rate = np.zeros(size, dtype=np.float64)
+
+        # number of vehicles (highest id + 1)
+        self.count = 0
+
+    def __len__(self):
+        return len(self.battery)
+
+    def grow(self, size: int):
+        # Resize the arrays to at least size vehicles (doubling)
+        n = len(self)
+        while n < size:
+            n *= 2
+        extra = n - len(self)
+        self.battery = np.concatenate((self.battery, np.ones(extra)))
+        self.type = np.concatenate((self.type, np.zeros(extra, dtype=np.int8)))
+        self.charge_start_time = np.concatenate((self.charge_start_time, np.full(extra, np.nan)))
+        self.charge_rate = np.concatenate((self.charge_rate, np.zeros(extra)))
+
+    def vehicle_class(self, cls: type) -> type:
+        # Class with the behaviour and configuration of the vehicle class cls (already configured)
+        # whose vehicles are stored in this fleet, it can be passed to the vehicle deployment functions
+        self.types.append(cls)
+        return type(cls.__name__, (FleetVehicle,), {
+            "__slots__": (),
+            "fleet": self,
+            "type_index": len(self.types) - 1,
+            "max_capacity": cls.max_capacity,
+            "energy_consumption": cls.energy_consumption,
+        })
+
+class FleetVehicle(Vehicle):
+    # Vehicle whose state is stored in a Fleet, only the id is stored in the object
+    __slots__ = ("id",)
+
+    fleet = None
+    type_index = 0
+
+    def __init__(self, vehicle_id):
+        if vehicle_id >= len(self.fleet):
+            self.fleet.grow(vehicle_id + 1)
+        self.fleet.count = max(self.fleet.count, vehicle_id + 1)
+        self.fleet.type[vehicle_id] = self.type_index
+        super().__init__(vehicle_id)
+
+    @property
+    def battery(self):
+        return self.fleet.battery[self.id]
+
+    @battery.setter
+    def battery(self, value):
+        self.fleet.battery[self.id] = value
+
+    @property
+    def charge_start_time(self):
+        time = self.fleet.charge_start_time[self.id]
+        return None if time != time else time
+
+    @charge_start_time.setter
+    def charge_start_time(self, value):
+        self.fleet.charge_start_time[self.id] = np.nan if value is None else value
+
+    @property
+    def charge_rate(self):
+        return self.fleet.charge_rate[self.id]
+
+    @charge_rate.setter
+    def charge_rate(self, value):
+        self.fleet.charge_rate[self.id] = value
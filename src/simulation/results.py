@@ -0,0 +1,173 @@
+import numpy as np
+import os
+
+# Columns of the trip table (one row for each completed trip)
+COLUMNS = ["User ID", "Start Time", "From Station", "To Station", "Vehicle ID", "Unlock Time", "Lock Time", "Total Time", "Battery Used", "Distance", "Velocity"]
+
+DTYPE = np.dtype([
+    ("User ID", np.int64),
+    ("Start Time", np.float64),
+    ("From Station", np.int64),
+    ("To Station", np.int64),
+    ("Vehicle ID", np.int64),
+    ("Unlock Time", np.float64),
+    ("Lock Time", np.float64),
+    ("Total Time", np.float64),
+    ("Battery Used", np.float64),
+    ("Distance", np.float64),
+    ("Velocity", np.float64),
+])
+
+# Compact types of the columns, used to read large result files in blocks (see iter_records)
+COMPACT_DTYPE = np.dtype([
+    ("User ID", np.int32),
+    ("Start Time", np.float32),
+    ("From Station", np.int32),
+    ("To Station", np.int32),
+    ("Vehicle ID", np.int32),
+    ("Unlock Time", np.float32),
+    ("Lock Time", np.float32),
+    ("Total Time", np.float32),
+    ("Battery Used", np.float32),
+    ("Distance", np.float32),
+    ("Velocity", np.float32),
+])
+
+class ResultCollector:
+    # Collects the completed trips in memory, in chunks of preallocated NumPy records
+    # The trips are written to result.csv (or result.npy) in large blocks:
+    # when close() is called or, with flush, every time a chunk is full.
+    # records() returns the trips as a structured array for analyze_results without reading the file back.
+    # With an accumulator (see metrics.TripAccumulator) each block of trips is also fed to it as soon as it is full.
+
+    def __init__(self, dir_path: str = None, params: dict = None, accumulator = None):
+        # params: {
+        #     "format": "csv" | "npy",  (default "csv")
+        #     "chunk_size": int,        (records for each chunk, default 65536)
+        #     "flush": bool,            (write each chunk as soon as it is full, default false)
+        #     "keep": bool              (keep the written chunks in memory, default true)
+        # }
+        # without dir_path nothing is written to disk (keep false then needs an accumulator)
+        params = params or {}
+
+        self.format = params.get("format", "csv")
+        if self.format not in ("csv", "npy"):
+            raise ValueError("Invalid result format {}".format(self.format))
+
+        self.chunk_size = params.get("chunk_size", 65536)
+        self.flush_full_chunks = params.get("flush", False)
+        self.keep = params.get("keep", True)
+
+        self.path = None if dir_path is None else os.path.join(dir_path, "result." + self.format)
+        self.accumulator = accumulator
+
+        # without keep the full chunks are dropped once written or accumulated, they need a destination
+        if not self.keep and self.path is None and self.accumulator is None:
+            raise ValueError("Results with keep false need a dir_path or an accumulator")
+
+        self.chunks = []    # full chunks kept in memory
+        self.written = 0    # number of full chunks already written to disk
+        self.chunk = np.empty(self.chunk_size, dtype=DTYPE)
+        self.row = 0
+        self.count = 0
+
+        # npy files need the number of records in the header, chunks are written to a temporary raw file
+        if self.path is not None:
+            if self.format == "csv":
+                with open(self.path, "w") as f:
+                    print(",".join(COLUMNS), file=f)
+            else:
+                open(self.path + ".tmp", "wb").close()
+
+    def append(self, user_id, start_time, from_station, to_station, vehicle_id, unlock_time, lock_time, total_time, battery_used, distance, velocity):
+        self.chunk[self.row] = (user_id, start_time, from_station, to_station, vehicle_id, unlock_time, lock_time, total_time, battery_used, distance, velocity)
+        self.row += 1
+        self.count += 1
+
+        if self.row == self.chunk_size:
+            if self.accumulator is not None:
+                self.accumulator.update(self.chunk)
+            self.chunks.append(self.chunk)
+            self.chunk = np.empty(self.chunk_size, dtype=DTYPE)
+            self.row = 0
+
+            if self.flush_full_chunks:
+                self.flush()
+
+    def __len__(self):
+        return self.count
+
+    def write(self, records: np.ndarray):
+        # Append records to the result file
+        if self.format == "csv":
+            columns = [records[name].tolist() for name in COLUMNS]
+            with open(self.path, "a") as f:
+                f.writelines("{},{},{},{},{},{},{},{},{},{},{}\n".format(*row) for row in zip(*columns))
+        else:
+            with open(self.path + ".tmp", "ab") as f:
+                records.tofile(f)
+
+    def flush(self):
+        # Write the full chunks that haven't been written yet
+        if self.path is not None:
+            for chunk in self.chunks[self.written:]:
+                self.write(chunk)
+        self.written = len(self.chunks)
+
+        if not self.keep:
+            self.chunks = []
+            self.written = 0
+
+    def close(self):
+        # Write all the remaining trips
+        self.flush()
+        if self.accumulator is not None:
+            self.accumulator.update(self.chunk[:self.row])
+        if self.path is not None:
+            if self.row > 0:
+                self.write(self.chunk[:self.row])
+
+            if self.format == "npy":
+                records = np.fromfile(self.path + ".tmp", dtype=DTYPE)
+                np.save(self.path, records)
+                os.remove(self.path + ".tmp")
+
+    def records(self) -> np.ndarray:
+        # All the trips as a structured array (read from the file if the written chunks aren't kept in memory)
+        if not self.keep and self.path is not None:
+            return load_records(os.path.dirname(self.path))
+        return np.concatenate(self.chunks + [self.chunk[:self.row]])
+
+    def last(self, n: int) -> np.ndarray:
+        # The last n trips (at most, without keep only the trips still in memory)
+        records = self.chunk[max(0, self.row - n):self.row]
+        for chunk in reversed(self.chunks):
+            if len(records) >= n:
+                break
+            records = np.concatenate((chunk[max(0, len(chunk) - n + len(records)):], records))
+        return records
+
+def load_records(dir_path: str) -> np.ndarray:
+    # Read the trips saved in dir_path (result.npy or result.csv)
+    if os.path.exists(os.path.join(dir_path, "result.npy")):
+        return np.load(os.path.join(dir_path, "result.npy"))
+    return np.loadtxt(os.path.join(dir_path, "result.csv"), delimiter=",", skiprows=1, dtype=DTYPE, ndmin=1)
+
+def iter_records(dir_path: str, chunk_size: int = 65536, dtype: np.dtype = COMPACT_DTYPE):
+    # Iterate over the trips saved in dir_path in blocks of chunk_size records of the given dtype
+    # Only one block is in memory: result.npy is memory mapped, result.csv is parsed a block at a time
+    if os.path.exists(os.path.join(dir_path, "result.npy")):
+        records = np.load(os.path.join(dir_path, "result.npy"), mmap_mode="r")
+        for start in range(0, len(records), chunk_size):
+            yield records[start:start + chunk_size].astype(dtype)
+        return
+
+    import pandas as pd
+    reader = pd.read_csv(os.path.join(dir_path, "result.csv"), chunksize=chunk_size,
+                         dtype={name: dtype[name] for name in dtype.names}, engine="c")
+    with reader:
+        for chunk in reader:
+            records = np.empty(len(chunk), dtype=dtype)
+            for name in dtype.names:
+                records[name] = chunk[name].to_numpy()
+            yield records
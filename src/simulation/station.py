@@ -1,10 +1,8 @@
 from environment.env import Environment
-from environment.constants import timeout
-from environment.process import Process, Interrupt
 
 from simulation.vehicle import Vehicle
 from simulation.station_storage import StationStorage
-from simulation.utils import log
+from simulation import trace
 
 class Station:
     def __init__(self, env: Environment, station_id: int, position: tuple, capacity_per_time: float, max_concurrent_charging: int, vehicles: StationStorage):
@@ -19,59 +17,75 @@ class Station:
         self.position = position
         self.charging_vehicles = {}
 
-    def charge(self, vehicle: Vehicle, now: float):
-        # Process for charging a vehicle for a specified amount of time
-        try:
-            log("Charging vehicle {} with battery {}% in station {}".format(vehicle.id, vehicle.battery*100, self.id))
+        # charges stopped by reschedule_charging and charges it kept running instead of restarting them
+        self.preemptions = 0
+        self.preemptions_avoided = 0
 
-            # Calculate the time needed to fully charge the vehicle
-            time = vehicle.capacity_used() / self.capacity_per_time
-            
-            yield timeout(time)
-            
-            vehicle.fully_charge()
+    def start_charge(self, vehicle: Vehicle, now: float):
+        # Start charging a vehicle, charged is called when it is fully charged
+        # The event can be cancelled by stop_charge before the vehicle is fully charged
+        if trace.charge:
+            trace.write(trace.CHARGE_START, now, 0, self.id, vehicle.id, vehicle.battery*100)
 
-            log("Charged vehicle {} in {} unit of time".format(vehicle.id, time))
+        # Calculate the time needed to fully charge the vehicle
+        time = vehicle.capacity_used() / self.capacity_per_time
 
-            # Notify the station storage that the vehicle is fully charged
-            self.vehicles.charged(vehicle)
-            
-            # Charge the next vehicle in the queue
-            self.charge_next_vehicle()
+        charging_event = self.env.call_at(now + time, self.charged, vehicle, time)
+        # keep the start time to compute the charge of the vehicle if the event is cancelled
+        self.charging_vehicles[vehicle] = (charging_event, now)
+
+    def charged(self, vehicle: Vehicle, time: float):
+        vehicle.fully_charge()
+
+        if trace.charge:
+            trace.write(trace.CHARGE_END, self.env.now(), 0, self.id, vehicle.id, time)
+
+        # Notify the station storage that the vehicle is fully charged
+        self.vehicles.charged(vehicle)
         
-        except Interrupt:
-            log("Charging interrupted for vehicle {} at {}".format(vehicle.id, self.env.now()))
-            
-            # Calculate the time the vehicle has been charging
-            charged_time = self.env.now() - now
-            before = vehicle.battery
-            vehicle.charge(charged_time * self.capacity_per_time / vehicle.max_capacity)
-            log("Charged vehicle {} of {}% in station {}".format(vehicle.id, (vehicle.battery-before)*100, self.id))
+        # Charge the next vehicle in the queue
+        self.charge_next_vehicle(self.env.now())
 
         # Remove the vehicle from the list of charging vehicles
         del self.charging_vehicles[vehicle]
 
-    def charge_next_vehicle(self):
+    def stop_charge(self, vehicle: Vehicle, now: float):
+        # Cancel the charging event of a vehicle and charge it for the time it has been charging
+        charging_event, start = self.charging_vehicles.pop(vehicle)
+        self.env.cancel(charging_event)
+
+        if trace.charge:
+            trace.write(trace.CHARGE_STOP, now, 0, self.id, vehicle.id)
+        
+        # Calculate the time the vehicle has been charging
+        charged_time = now - start
+        before = vehicle.battery
+        vehicle.charge(charged_time * self.capacity_per_time / vehicle.max_capacity)
+        if trace.charge:
+            trace.write(trace.CHARGE_PARTIAL, now, 0, self.id, vehicle.id, (vehicle.battery-before)*100)
+
+    def charge_next_vehicle(self, now: float):
         # Charge the next vehicle in the queue if there is one
-        to_charge = self.vehicles.next_vehicle_to_charge(list(self.charging_vehicles.keys()))
+        to_charge = self.vehicles.next_vehicle_to_charge(self.charging_vehicles)
         if to_charge is not None:
-            charging_process = Process(self.env.now(), self.charge(to_charge, self.env.now()))
-            self.env.add_process(charging_process)
-            self.charging_vehicles[to_charge] = charging_process
-
-    def stop_charging(self):
-        # Interrupt the charging process for all vehicles
-        keys = list(self.charging_vehicles.keys())
-        for key in keys:
-            try:
-                self.charging_vehicles[key].interrupt()
-            except StopIteration:
-                pass
-
-    def start_charging(self):
-        # Start charging the next vehicles up to the maximum number of concurrent charging
-        for _ in range(self.max_concurrent_charging):
-            self.charge_next_vehicle()
+            self.start_charge(to_charge, now)
+
+    def reschedule_charging(self, now: float):
+        # Charge the first max_concurrent_charging vehicles in the order of the station storage
+        # Only the vehicles that left this set are stopped and only the ones that joined it are started,
+        # the others keep charging without being preempted
+        to_charge = self.vehicles.vehicles_to_charge(self.max_concurrent_charging)
+
+        for vehicle in [v for v in self.charging_vehicles if v not in to_charge]:
+            self.stop_charge(vehicle, now)
+            self.preemptions += 1
+
+        # vehicles that would have been stopped and restarted
+        self.preemptions_avoided += len(self.charging_vehicles)
+
+        for vehicle in to_charge:
+            if vehicle not in self.charging_vehicles:
+                self.start_charge(vehicle, now)
 
     def request_lock(self, process):
         # Request a vehicle to the station
@@ -81,13 +95,13 @@ class Station:
         # Lock a vehicle to the station
         self.vehicles.lock(vehicle)
 
-        log("Station {} has {} vehicles at {}".format(self.id, self.vehicles.count(), self.env.now()))
+        if trace.station:
+            trace.write(trace.STATION_COUNT, self.env.now(), self.vehicles.count(), self.id)
         assert self.vehicles.count() <= self.vehicles.max_capacity(), "Station {} has {} vehicles".format(self.id, self.vehicles.count())
         
         # Check if the station needs to reschedule charging
         if len(self.charging_vehicles) < self.max_concurrent_charging or self.vehicles.need_reschedule(self.charging_vehicles.keys()):
-            self.stop_charging()
-            self.start_charging()
+            self.reschedule_charging(self.env.now())
     
     def request_unlock(self, user):
         # Request a vehicle from the station
@@ -95,7 +109,8 @@ class Station:
 
     def unlock(self) -> Vehicle:
         v = self.vehicles.unlock()
-        log("Station {} has {} vehicles at {}".format(self.id, self.vehicles.count(), self.env.now()))
+        if trace.station:
+            trace.write(trace.STATION_COUNT, self.env.now(), self.vehicles.count(), self.id)
         assert self.vehicles.count() <= self.vehicles.max_capacity(), "Station {} has {} vehicles".format(self.id, self.vehicles.count())
         return v
     
@@ -109,6 +124,105 @@ class Station:
 
     def count(self):
         return self.vehicles.count()
+
+    def queue_statistics(self) -> dict:
+        # Accounting of the resources of the station storage up to now (see Resource.stats)
+        return {name: resource.stats() for name, resource in self.vehicles.resources().items()}
     
     def max_capacity(self):
-        return self.vehicles.max_capacity()
\ No newline at end of file
+        return self.vehicles.max_capacity()
+
+class AnalyticStation(Station):
+    # Station that models charging analytically instead of with an event for each charge
+    # Each charging vehicle records when its charge started (charge_start_time) and its rate (charge_rate),
+    # charging_vehicles maps each charging vehicle to the time it will be fully charged.
+    # Completed charges are applied lazily, when the station is locked or unlocked,
+    # in the same order and with the same arithmetic as the charging events of Station.
+    # The only scheduled event is the time the next vehicle to unlock is fully charged
+    # (or the next completed charge, if that vehicle is still waiting to be charged),
+    # so the unlock and lock times are the same as with Station.
+
+    def __init__(self, env: Environment, station_id: int, position: tuple, capacity_per_time: float, max_concurrent_charging: int, vehicles: StationStorage):
+        super().__init__(env, station_id, position, capacity_per_time, max_concurrent_charging, vehicles)
+
+        # event scheduled at the next completed charge the station must react to
+        self.wake_event = None
+
+    def update(self, now: float):
+        # Apply the charges completed up to now, in order of completion
+        while self.charging_vehicles:
+            vehicle, completion = min(self.charging_vehicles.items(), key=lambda item: item[1])
+            if completion > now:
+                break
+
+            if trace.charge:
+                trace.write(trace.CHARGE_END, completion, 0, self.id, vehicle.id, completion - vehicle.charge_start_time)
+
+            vehicle.fully_charge()
+            vehicle.charge_start_time = None
+
+            # Notify the station storage that the vehicle is fully charged
+            self.vehicles.charged(vehicle)
+
+            # Charge the next vehicle in the queue, starting when this one was fully charged
+            self.charge_next_vehicle(completion)
+
+            del self.charging_vehicles[vehicle]
+
+    def schedule_wake(self):
+        # Schedule the wake event when the next vehicle to unlock is fully charged
+        # if that vehicle isn't charging yet, wake up at the next completed charge to start charging it
+        time = None
+        top = self.vehicles.next_vehicle_to_unlock()
+        if top is not None and not top.is_charged():
+            if top in self.charging_vehicles:
+                time = self.charging_vehicles[top]
+            elif self.charging_vehicles:
+                time = min(self.charging_vehicles.values())
+
+        if self.wake_event is not None:
+            if self.wake_event.time == time:
+                return
+            self.env.cancel(self.wake_event)
+            self.wake_event = None
+
+        if time is not None:
+            self.wake_event = self.env.call_at(time, self.wake)
+
+    def wake(self):
+        self.wake_event = None
+        self.update(self.env.now())
+        self.schedule_wake()
+
+    def start_charge(self, vehicle: Vehicle, now: float):
+        if trace.charge:
+            trace.write(trace.CHARGE_START, now, 0, self.id, vehicle.id, vehicle.battery*100)
+
+        vehicle.charge_start_time = now
+        vehicle.charge_rate = self.capacity_per_time
+        self.charging_vehicles[vehicle] = now + vehicle.capacity_used() / self.capacity_per_time
+
+    def stop_charge(self, vehicle: Vehicle, now: float):
+        # Stop charging a vehicle and charge it for the time it has been charging
+        del self.charging_vehicles[vehicle]
+
+        if trace.charge:
+            trace.write(trace.CHARGE_STOP, now, 0, self.id, vehicle.id)
+
+        # battery level with the charge received since charge_start_time
+        before = vehicle.battery
+        vehicle.battery = vehicle.battery_at(now)
+        vehicle.charge_start_time = None
+        if trace.charge:
+            trace.write(trace.CHARGE_PARTIAL, now, 0, self.id, vehicle.id, (vehicle.battery-before)*100)
+
+    def lock(self, vehicle: Vehicle):
+        self.update(self.env.now())
+        super().lock(vehicle)
+        self.schedule_wake()
+
+    def unlock(self) -> Vehicle:
+        self.update(self.env.now())
+        v = super().unlock()
+        self.schedule_wake()
+        return v
@@ -11,6 +11,8 @@ class StationStorage(ABC):
     # The station storage is also responsible for selecting the next vehicle to charge
 
     # Note: the station storage is not responsible for charging vehicles
+
+    # charging_vehicles is a collection with O(1) membership test (the charging_vehicles dict of the station)
     
     # Warning: the __init__ method requires the following parameters:
     # - env: simpy.Environment
@@ -24,14 +26,25 @@ class StationStorage(ABC):
         pass
 
     @abstractmethod
-    def next_vehicle_to_charge(self, charging_vehicles: list):
+    def next_vehicle_to_charge(self, charging_vehicles):
+        # Return the next vehicle to charge that isn't already charging (None if there is none)
+        pass
+
+    @abstractmethod
+    def vehicles_to_charge(self, n: int) -> list:
+        # Return the first n vehicles to charge, in order, whether they are charging or not
         pass
 
     @abstractmethod
-    def need_reschedule(self):
+    def need_reschedule(self, charging_vehicles):
         # Check if the station storage needs to reschedule the charging of vehicles
         pass
     
+    @abstractmethod
+    def next_vehicle_to_unlock(self) -> Vehicle:
+        # Return the vehicle that will be unlocked next (None if the station storage is empty)
+        pass
+
     @abstractmethod
     def request_lock(self, process: Process):
         # Wait for a slot to be available
@@ -69,11 +82,55 @@ class StationStorage(ABC):
         # Return the maximum number of vehicles that can be stored in the station storage
         pass
 
+    def resources(self) -> dict:
+        # Return the resources the users wait on: "unlock" (a vehicle) and "lock" (a slot)
+        # their accounting is saved in stations.csv
+        return {}
+
+def next_uncharged(uncharged: dict, charging_vehicles):
+    # Return the last vehicle of the uncharged index that isn't charging
+    # Vehicles fully charged without a charged() notification (a partial charge that filled the battery)
+    # are removed from the index when found
+    found = None
+    stale = []
+    for vehicle in reversed(uncharged):
+        if vehicle in charging_vehicles:
+            continue
+        if vehicle.is_charged():
+            stale.append(vehicle)
+            continue
+        found = vehicle
+        break
+
+    for vehicle in stale:
+        del uncharged[vehicle]
+
+    return found
+
+def first_uncharged(uncharged: dict, n: int) -> list:
+    # Return the last n vehicles of the uncharged index, starting from the last one
+    # Vehicles fully charged without a charged() notification are removed from the index when found
+    found = []
+    stale = []
+    for vehicle in reversed(uncharged):
+        if len(found) == n:
+            break
+        if vehicle.is_charged():
+            stale.append(vehicle)
+        else:
+            found.append(vehicle)
+
+    for vehicle in stale:
+        del uncharged[vehicle]
+
+    return found
+
 class LIFO(StationStorage):
     # Concrete class implementing a Last In, First Out (LIFO) station storage
     # Vehicles are stored in a list and the last vehicle added is the first to be removed
     # Charging is rescheduled every time a vehicle is added to the station storage
     # The next vehicle to charge is the last vehicle in the list that needs charging
+    # The vehicles that need charging are indexed in a dict in the same order of the list
     
     def __init__(self, env: Environment, params: dict):
         # params: {
@@ -88,24 +145,34 @@ class LIFO(StationStorage):
         
         self.vehicles = []
 
+        # vehicles of the list that aren't fully charged, in the order of the list (dicts keep insertion order)
+        self.uncharged = {}
+
     def charged(self, vehicle: Vehicle):
+        self.uncharged.pop(vehicle, None)
+
         # If the vehicle is the last one in the list then the last slot is charged so is available
         if self.vehicles and self.vehicles[-1] == vehicle:
             self.available_vehicles.release()    
 
-    def next_vehicle_to_charge(self, charging_vehicles: list):
+    def next_vehicle_to_charge(self, charging_vehicles):
         # Select the last vehicle in the list that needs charging
-        for vehicle in [v for v in self.vehicles if v not in charging_vehicles][::-1]:
-            if not vehicle.is_charged():
-                return vehicle
-        return None
+        return next_uncharged(self.uncharged, charging_vehicles)
+
+    def vehicles_to_charge(self, n: int) -> list:
+        # The last vehicles in the list that need charging
+        return first_uncharged(self.uncharged, n)
     
-    def need_reschedule(self, charging_vehicles: list):
+    def need_reschedule(self, charging_vehicles):
         # Called when a vehicle is added to the station storage
         # The battery of the new vehicle isn't full (just used for moving to the station)
         # means that the last vehicle in the list needs to be charged
         # so the charging needs to be rescheduled
         return True
+
+    def next_vehicle_to_unlock(self) -> Vehicle:
+        # The last vehicle in the list is the next to be unlocked
+        return self.vehicles[-1] if self.vehicles else None
     
     def request_lock(self, process):
         # Wait for a slot to be available
@@ -114,6 +181,9 @@ class LIFO(StationStorage):
     def lock(self, vehicle: Vehicle):
         self.vehicles.append(vehicle)
 
+        if not vehicle.is_charged():
+            self.uncharged[vehicle] = None
+
         if vehicle.is_charged():
             # If the vehicle is fully charged then the last slot is available
             self.available_vehicles.release()
@@ -127,6 +197,7 @@ class LIFO(StationStorage):
     
     def unlock(self) -> Vehicle:
         v = self.vehicles.pop()
+        self.uncharged.pop(v, None)
         # return true if some process is waiting for a slot
         if not self.slots.release():
             # if some process is waiting for a slot then the last slot is not available
@@ -146,6 +217,8 @@ class LIFO(StationStorage):
         # Add the vehicles to the station storage and use a slot for each vehicle
         for v in vehicles:
             self.vehicles.append(v)
+            if not v.is_charged():
+                self.uncharged[v] = None
 
         if self.vehicles and self.vehicles[-1].is_charged():
             # If the last vehicle is fully charged then there is an available vehicle
@@ -157,10 +230,14 @@ class LIFO(StationStorage):
         # Return the maximum number of vehicles that can be stored in the station storage
         return self.capacity
 
+    def resources(self) -> dict:
+        return {"unlock": self.available_vehicles, "lock": self.slots}
+
 class DualStack(StationStorage):
     # Concrete class implementing a Dual Stack station storage
     # Vehicles are stored in two lists, one is used to insert vehicles and the other is used to remove vehicles
     # The lists are swapped when the first list is empty or the second list is full
+    # The vehicles that need charging are indexed in a dict for each list, in the same order of the list
 
     def __init__(self, env: Environment, params: dict):
         # params: {
@@ -184,9 +261,14 @@ class DualStack(StationStorage):
         self.insert_stack = self.stack1
         self.remove_stack = self.stack2
 
+        # vehicles of each stack that aren't fully charged, in the order of the stack (dicts keep insertion order)
+        self.insert_uncharged = {}
+        self.remove_uncharged = {}
+
     def swap_stacks(self):
         # Swap the insert and remove stacks
         self.insert_stack, self.remove_stack = self.remove_stack, self.insert_stack
+        self.insert_uncharged, self.remove_uncharged = self.remove_uncharged, self.insert_uncharged
 
         # If the last vehicle in the remove stack is fully charged then there is an available vehicle
         # Otherwise the last vehicle is not available
@@ -196,29 +278,38 @@ class DualStack(StationStorage):
             self.available_vehicles.block()
 
     def charged(self, vehicle: Vehicle):
+        self.insert_uncharged.pop(vehicle, None)
+        self.remove_uncharged.pop(vehicle, None)
+
         # If the vehicle is the last one in the remove stack then the last slot is charged so is available
         if self.remove_stack and self.remove_stack[-1] == vehicle:
             self.available_vehicles.release()
 
-    def next_vehicle_to_charge(self, charging_vehicles: list):
-        # first check in the remove stack
-        for vehicle in [v for v in self.remove_stack if v not in charging_vehicles][::-1]:
-            if not vehicle.is_charged():
-                return vehicle
-        
-        # then check in the insert stack
-        for vehicle in [v for v in self.insert_stack if v not in charging_vehicles][::-1]:
-            if not vehicle.is_charged():
-                return vehicle
-            
-        return None
+    def next_vehicle_to_charge(self, charging_vehicles):
+        # first check in the remove stack, then check in the insert stack
+        vehicle = next_uncharged(self.remove_uncharged, charging_vehicles)
+        if vehicle is None:
+            vehicle = next_uncharged(self.insert_uncharged, charging_vehicles)
+        return vehicle
+
+    def vehicles_to_charge(self, n: int) -> list:
+        # first the vehicles in the remove stack, then the ones in the insert stack
+        vehicles = first_uncharged(self.remove_uncharged, n)
+        if len(vehicles) < n:
+            vehicles += first_uncharged(self.insert_uncharged, n - len(vehicles))
+        return vehicles
     
-    def need_reschedule(self, charging_vehicles: list):
+    def need_reschedule(self, charging_vehicles):
         # Called when a vehicle is added to the insert stack
         # The battery of the new vehicle isn't full (just used for moving to the station)
         # means that the last vehicle in the insert stack isn't fully charged
         # so the charging needs to be rescheduled only if there are charging vehicles in the insert stack
-        return any([v in charging_vehicles for v in self.insert_stack])
+        # (charging vehicles aren't fully charged so they are indexed in insert_uncharged)
+        return any(v in self.insert_uncharged for v in charging_vehicles)
+
+    def next_vehicle_to_unlock(self) -> Vehicle:
+        # The last vehicle in the remove stack is the next to be unlocked
+        return self.remove_stack[-1] if self.remove_stack else None
 
     def count(self):
         # Return the number of vehicles currently stored in the station storage
@@ -231,6 +322,8 @@ class DualStack(StationStorage):
     def lock(self, vehicle: Vehicle):
         # add the vehicle to the station storage
         self.insert_stack.append(vehicle)
+        if not vehicle.is_charged():
+            self.insert_uncharged[vehicle] = None
 
         # If the insert stack is full then swap the stacks
         size = self.stack1_size if self.insert_stack == self.stack1 else self.stack2_size
@@ -244,6 +337,7 @@ class DualStack(StationStorage):
     def unlock(self) -> Vehicle:
         # return the available vehicle
         v = self.remove_stack.pop()
+        self.remove_uncharged.pop(v, None)
         
         self.slots.release()
         
@@ -276,6 +370,9 @@ class DualStack(StationStorage):
         self.remove_stack = self.stack1
         self.insert_stack = self.stack2
 
+        self.remove_uncharged = {v: None for v in self.remove_stack if not v.is_charged()}
+        self.insert_uncharged = {v: None for v in self.insert_stack if not v.is_charged()}
+
         self.slots.initial(self.stack1_size + self.stack2_size - len(vehicles))
 
         if self.remove_stack and self.remove_stack[-1].is_charged():
@@ -286,3 +383,7 @@ class DualStack(StationStorage):
         # Return the maximum number of vehicles that can be stored in the station storage
         return self.stack1_size + self.stack2_size
 
+    def resources(self) -> dict:
+        return {"unlock": self.available_vehicles, "lock": self.slots}
+
+
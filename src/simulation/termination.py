@@ -0,0 +1,81 @@
+from environment.env import Environment
+from simulation.results import ResultCollector
+
+import time
+
+# Termination of the simulation
+#
+# The simulation ends when no event is left, at the horizon (run_time) or when a criterion of the
+# "termination" section of the configuration is met:
+#     "termination": {
+#         "wall_time": float,          (seconds of real time, optional)
+#         "check_interval": float,     (simulation time between two checks, default 10)
+#         "convergence": [             (optional)
+#             {"type": "moving_average", "parameters": {...}}
+#         ]
+#     }
+# The criteria are checked by an event every check_interval, so they don't cost anything between two checks.
+# A convergence criterion is a function of this module called with the results and its parameters,
+# it returns a function that tells whether the simulation has converged.
+
+def moving_average(results: ResultCollector, params: dict):
+    # Converged when the average of a column over the last window trips differs from the average
+    # over the previous window trips by at most tolerance (relative)
+    # params: {
+    #     "column": str,       (column of the trip table, default "Unlock Time")
+    #     "window": int,       (trips for each average, default 1000)
+    #     "tolerance": float,  (default 0.01)
+    #     "min_trips": int     (completed trips before the first check, default 2 * window)
+    # }
+    column = params.get("column", "Unlock Time")
+    window = params.get("window", 1000)
+    tolerance = params.get("tolerance", 0.01)
+    min_trips = params.get("min_trips", 2 * window)
+
+    def converged() -> bool:
+        if len(results) < max(min_trips, 2 * window):
+            return False
+        values = results.last(2 * window)[column]
+        previous, current = values[:window].mean(), values[window:].mean()
+        return abs(current - previous) <= tolerance * max(abs(previous), abs(current))
+
+    return converged
+
+class Termination:
+    def __init__(self, env: Environment, results: ResultCollector, params: dict = None):
+        params = params or {}
+
+        self.env = env
+        self.wall_time = params.get("wall_time")
+        self.check_interval = params.get("check_interval", 10)
+
+        # (name, converged) of each convergence criterion
+        self.criteria = []
+        try:
+            for criterion in params.get("convergence", []):
+                factory = getattr(__import__("simulation.termination", fromlist=[criterion["type"]]), criterion["type"])
+                self.criteria.append((criterion["type"], factory(results, criterion.get("parameters", {}))))
+        except (AttributeError, KeyError):
+            raise Exception(f'Invalid termination criterion {criterion}')
+
+        self.start = None
+
+    def run(self, until: float = None) -> str:
+        # Run the simulation until it ends, returns the reason (see Environment.run):
+        # "empty", "until", "wall_time" or "convergence: NAME"
+        self.start = time.perf_counter()
+        if self.wall_time is not None or self.criteria:
+            self.env.call_in(self.check_interval, self.check)
+        return self.env.run(until)
+
+    def check(self):
+        if self.wall_time is not None and time.perf_counter() - self.start >= self.wall_time:
+            self.env.stop("wall_time")
+
+        for name, converged in self.criteria:
+            if converged():
+                self.env.stop("convergence: " + name)
+
+        # no other event: the simulation is over, don't keep it running
+        if self.env.processes:
+            self.env.call_in(self.check_interval, self.check)
@@ -0,0 +1,113 @@
+import struct, sys
+
+# Binary trace of the simulation events (log.bin)
+#
+# Tracing is enabled by category, the call sites check the category flag before building any argument:
+#     if trace.user:
+#         trace.write(trace.USER_START, now, user_id, station_id)
+# With tracing disabled the cost of a trace point is the flag check.
+#
+# Each event is a fixed-size record (type, time, three ids, two values) written through a large buffer.
+# The text of the log is rendered offline from the records:
+#     python3 -m simulation.trace log.bin [log.log]
+
+MAGIC = b"BSTRACE1"
+
+# type: uint8, time: float64, ids: 3 x int32, values: 2 x float64
+RECORD = struct.Struct("<Bdiiidd")
+
+# Event types
+USER_START = 0
+USER_REQUEST_UNLOCK = 1
+USER_UNLOCKED = 2
+USER_ARRIVED = 3
+USER_REQUEST_LOCK = 4
+USER_LOCKED = 5
+USER_FINISHED = 6
+STATION_COUNT = 7
+CHARGE_START = 8
+CHARGE_END = 9
+CHARGE_STOP = 10
+CHARGE_PARTIAL = 11
+
+# Text of each event type: a, b, c are the ids, x, y the values, time the simulation time of the event
+MESSAGES = {
+    USER_START: "User {a} from station {b} to station {c}",
+    USER_REQUEST_UNLOCK: "User {a} requesting vehicle from station {b} at {time}",
+    USER_UNLOCKED: "User {a} got vehicle {c} with battery {x}% from station {b} at {time}",
+    USER_ARRIVED: "User {a} with vehicle {c} arrived to station {b} in {x} using {y}% battery",
+    USER_REQUEST_LOCK: "User {a} requesting lock in station {b} at {time}",
+    USER_LOCKED: "User {a} locked vehicle {c} in station {b} at {time}",
+    USER_FINISHED: "User {a} finished",
+    STATION_COUNT: "Station {b} has {a} vehicles at {time}",
+    CHARGE_START: "Charging vehicle {c} with battery {x}% in station {b}",
+    CHARGE_END: "Charged vehicle {c} in {x} unit of time",
+    CHARGE_STOP: "Charging interrupted for vehicle {c} at {time}",
+    CHARGE_PARTIAL: "Charged vehicle {c} of {x}% in station {b}",
+}
+
+CATEGORIES = ["user", "station", "charge"]
+
+# Category flags, checked by the call sites
+user = False
+station = False
+charge = False
+
+FILE = None
+
+def enable(path: str, categories: list = None, buffer_size: int = 1 << 20):
+    # Start writing the events of the given categories (all if None) to path
+    global FILE, user, station, charge
+
+    categories = CATEGORIES if categories is None else categories
+    for category in categories:
+        if category not in CATEGORIES:
+            raise ValueError("Invalid trace category {}".format(category))
+
+    FILE = open(path, "wb", buffering=buffer_size)
+    FILE.write(MAGIC)
+
+    user = "user" in categories
+    station = "station" in categories
+    charge = "charge" in categories
+
+def disable():
+    # Stop tracing and flush the buffered records
+    global FILE, user, station, charge
+
+    user = station = charge = False
+    if FILE is not None:
+        FILE.close()
+        FILE = None
+
+def write(event: int, time: float, a: int = 0, b: int = 0, c: int = 0, x: float = 0.0, y: float = 0.0):
+    FILE.write(RECORD.pack(event, time, a, b, c, x, y))
+
+def read(path: str):
+    # Iterate over the records of a trace file as (type, time, a, b, c, x, y) tuples
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise Exception(f'File {path} is not a trace file')
+        data = f.read()
+    return RECORD.iter_unpack(data)
+
+def value(v: float):
+    # Values are stored as float64, integral ones (like the 100% battery of the unlocked vehicles) are shown as ints
+    return int(v) if v.is_integer() else v
+
+def render(path: str, output):
+    # Write the text of each event of the trace file, one line per event
+    for event, time, a, b, c, x, y in read(path):
+        print(MESSAGES[event].format(time=time, a=a, b=b, c=c, x=value(x), y=value(y)), file=output)
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] in ("-h", "--help"):
+        print("Usage: python3 -m simulation.trace TRACE [OUTPUT]")
+        print("\tRender the binary trace TRACE (log.bin) as text, to OUTPUT or to the standard output")
+        exit()
+
+    if len(sys.argv) > 2:
+        with open(sys.argv[2], "w") as output:
+            render(sys.argv[1], output)
+    else:
+        render(sys.argv[1], sys.stdout)
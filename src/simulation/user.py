@@ -1,27 +1,48 @@
-from environment.constants import timeout
+from environment.constants import GETTED
+from environment.event import Event
 
 from simulation.station import Station
-from simulation.utils import get_directory_path, log
-import os
+from simulation import trace
 
 class User:
+    # Trip of a user as a chain of events (see Environment.call_at):
+    # start -> (vehicle available) unlocked -> (trip time) arrived -> (slot available) locked
+    # the state of the trip is passed to the next step as arguments of the event
+    __slots__ = ("id", "from_station", "to_station", "velocity")
+
+    # set on the class of the users of a simulation, see bind
     env = None
+    results = None  # ResultCollector of the completed trips
+
+    @classmethod
+    def bind(cls, env, results) -> type:
+        # Class of the users of a simulation, with its environment and the ResultCollector of its trips
+        # (the simulations of the same process don't share them)
+        return type(cls.__name__, (cls,), {"__slots__": (), "env": env, "results": results})
+
     def __init__(self, id: int, from_station: Station, to_station: Station, velocity: float):
         self.id = id
         self.from_station = from_station
         self.to_station = to_station
         self.velocity = velocity
-        self.process = None
 
-    def run(self):
+    def start(self):
+        # The user requests a vehicle from the departure station
         start_time = self.env.now()
 
-        log("User {} from station {} to station {}".format(self.id, self.from_station.id, self.to_station.id))
-        log("User {} requesting vehicle from station {} at {}".format(self.id, self.from_station.id, self.env.now()))
+        if trace.user:
+            trace.write(trace.USER_START, start_time, self.id, self.from_station.id, self.to_station.id)
+            trace.write(trace.USER_REQUEST_UNLOCK, start_time, self.id, self.from_station.id)
 
         request_time = self.env.now()
-        
-        yield self.from_station.request_unlock(self.process)
+
+        # the event waits for the vehicle, it is scheduled now if the vehicle is already available
+        waiting = Event(request_time, self.unlocked, (start_time, request_time))
+        if self.from_station.request_unlock(waiting) == GETTED:
+            self.env.awake(waiting)
+
+    def unlocked(self, start_time: float, request_time: float):
+        # The user gets the vehicle and moves it to the destination station
         vehicle = self.from_station.unlock()
         
         #self.to_station.is_available()
@@ -30,39 +51,42 @@ class User:
 
         battery = vehicle.battery*100
         assert battery == 100, "User {} got vehicle {} with battery {}% from station {} at {}".format(self.id, vehicle.id, battery, self.from_station.id, self.env.now)
-        log("User {} got vehicle {} with battery {}% from station {} at {}".format(self.id, vehicle.id, battery, self.from_station.id, self.env.now()))
+        if trace.user:
+            trace.write(trace.USER_UNLOCKED, self.env.now(), self.id, self.from_station.id, vehicle.id, battery)
 
         distance = self.from_station.distance(self.to_station)
         vehicle.move(distance)
         
         time = distance / self.velocity
         
-        yield timeout(time)
+        self.env.call_in(time, self.arrived, start_time, unlock_time, vehicle, battery, distance, time)
 
+    def arrived(self, start_time: float, unlock_time: float, vehicle, battery: float, distance: float, time: float):
+        # The user reaches the destination station and requests a slot
         battery_used = battery - vehicle.battery*100
 
-        log("User {} with vehicle {} arrived to station {} in {} using {}% battery".format(self.id, vehicle.id, self.to_station.id, time, battery_used))
-
-        log("User {} requesting lock in station {} at {}".format(self.id, self.to_station.id, self.env.now()))
+        if trace.user:
+            trace.write(trace.USER_ARRIVED, self.env.now(), self.id, self.to_station.id, vehicle.id, time, battery_used)
+            trace.write(trace.USER_REQUEST_LOCK, self.env.now(), self.id, self.to_station.id)
  
         request_time = self.env.now()
-        
-        yield self.to_station.request_lock(self.process)
 
+        waiting = Event(request_time, self.locked, (start_time, unlock_time, request_time, vehicle, battery_used, distance))
+        if self.to_station.request_lock(waiting) == GETTED:
+            self.env.awake(waiting)
+
+    def locked(self, start_time: float, unlock_time: float, request_time: float, vehicle, battery_used: float, distance: float):
+        # The user releases the vehicle to the destination station
         self.to_station.lock(vehicle)
         
         lock_time = self.env.now() - request_time
 
-
-        log("User {} locked vehicle {} in station {} at {}".format(self.id, vehicle.id, self.to_station.id, self.env.now()))
-        log("User {} finished".format(self.id))
+        if trace.user:
+            trace.write(trace.USER_LOCKED, self.env.now(), self.id, self.to_station.id, vehicle.id)
+            trace.write(trace.USER_FINISHED, self.env.now(), self.id)
 
         total_time = self.env.now() - start_time
         if total_time <= 0:
             print("User {} total time is less or equal to 0".format(self.id))
 
-        with open(os.path.join(get_directory_path(),"result.csv"), "a") as file:
-            # ["User ID", "Start Time", "From Station", "To Station", "Vehicle ID", "Unlock Time", "Lock Time", "Total Time", "Battery Used", "Distance", "Velocity"]
-            print("{},{},{},{},{},{},{},{},{},{},{}".format(self.id, start_time, self.from_station.id, self.to_station.id, vehicle.id, unlock_time, lock_time, total_time, battery_used, distance, self.velocity),
-                file=file,
-                flush=True)
+        self.results.append(self.id, start_time, self.from_station.id, self.to_station.id, vehicle.id, unlock_time, lock_time, total_time, battery_used, distance, self.velocity)
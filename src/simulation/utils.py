@@ -1,12 +1,10 @@
-import math, logging, os, json
+from collections import OrderedDict
+import os, json
+import numpy as np
 
-# Default directory path
-DEFAULT_DIRECTORY_PATH = None
-
-# Function to set the directory path
+# Function to create the directory of a simulation, returns its path
+# (the path is passed to whatever writes the results, there is no global output directory)
 def create_directory_path(path):
-    global DEFAULT_DIRECTORY_PATH
-    
     # se non esiste nessuna cartella per i risultati, crea la cartella result_0
     # altrimenti crea la cartella result_n+1
     i = 0
@@ -14,41 +12,8 @@ def create_directory_path(path):
         i += 1
     path = os.path.join(path, "simulation_{}".format(i))
     os.makedirs(path)
-    
-    DEFAULT_DIRECTORY_PATH = path
     return path
 
-# Function to get the current directory path
-def get_directory_path():
-    return DEFAULT_DIRECTORY_PATH
-
-# Logging
-LOGGER = None
-
-def log(message, level=logging.INFO):
-    global LOGGER
-    if LOGGER is not None:
-        LOGGER.log(level, message)
-
-def setup_logger(log_filename):
-    global LOGGER
-
-    # Set the log level for the root logger
-    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-
-    # Create a FileHandler and set the log file name
-    file_handler = logging.FileHandler(log_filename)
-    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
-
-    # Get the root logger and add the file handler
-    LOGGER = logging.getLogger()
-    LOGGER.addHandler(file_handler)
-
-    # Remove the console handler to disable console output
-    for handler in LOGGER.handlers:
-        if isinstance(handler, logging.StreamHandler):
-            LOGGER.removeHandler(handler)
-
 def load_config(config_path):
     try:
         with open(config_path, 'r') as file:
@@ -63,17 +28,75 @@ def load_config(config_path):
     return config_data
 
 
-def find_index_nearest_k_points(center: tuple, radius: float, points: list, k: int):
-    # Find the index of the point in the list of points that is closest to the circle defined by the center and the radius
-    distances = [abs(math.dist(center, point) - radius) for point in points]
-    # Sort the distances and get the first k indexes
-    return sorted(range(len(distances)), key=lambda k: distances[k])[:k]
+class StationIndex:
+    # Spatial index of the station positions used to select the origin and destination of the users
+    # For each station the distances to all the stations are computed once, the first time the station is queried,
+    # and kept sorted: queries around a station are answered with a binary search on its row
+    # instead of computing and sorting the distances to all the stations every time
+    # Memory: one row of N distances (float64) and N indexes (int32) for each queried station, 12 N bytes.
+    # Without a bound the rows of all the stations would take 12 N^2 bytes (and a LayoutCache keeps the index
+    # for a whole sweep), so at most max_memory bytes of rows are kept and the least recently used one is evicted.
+
+    # default bound of the memory of the rows (256 MB: all the rows up to about 4600 stations)
+    MAX_MEMORY = 1 << 28
+
+    def __init__(self, points: list, max_memory: int = MAX_MEMORY):
+        self.points = np.asarray(points, dtype=np.float64)
+        self.rows = OrderedDict()
+        self.max_rows = max(1, max_memory // (12 * max(1, len(self.points))))
+
+    def row(self, center: int):
+        # Sorted distances from the station center to all the stations and the corresponding indexes
+        row = self.rows.get(center)
+        if row is None:
+            delta = self.points - self.points[center]
+            distances = np.sqrt(delta[:, 0]*delta[:, 0] + delta[:, 1]*delta[:, 1])
+            order = np.argsort(distances, kind="stable").astype(np.int32)
+            row = self.rows[center] = (distances[order], order)
+            if len(self.rows) > self.max_rows:
+                self.rows.popitem(last=False)
+        else:
+            self.rows.move_to_end(center)
+        return row
+
+    def sorted_rows(self, centers: np.ndarray):
+        # Sorted distances from each station of centers to all the stations and the corresponding indexes
+        # (len(centers) x N arrays, not kept) used by the vectorized generation of the users
+        delta = self.points[None, :, :] - self.points[centers, None, :]
+        distances = np.sqrt(delta[..., 0]*delta[..., 0] + delta[..., 1]*delta[..., 1])
+        order = np.argsort(distances, axis=1, kind="stable").astype(np.int32)
+        return np.take_along_axis(distances, order, axis=1), order
+
+    def nearest_k(self, center: int, radius: float, k: int) -> list:
+        # The indexes of the k stations whose distance from the station center is closest to radius,
+        # ordered by |distance - radius| and then by index
+        distances, order = self.row(center)
+        n = len(distances)
+
+        # the k closest values to radius are among the k values on each side of its position in the sorted row,
+        # the window is extended to include the values equal to the ones on its boundaries
+        pos = np.searchsorted(distances, radius)
+        lo = max(0, pos - k)
+        hi = min(n, pos + k)
+        while lo > 0 and distances[lo - 1] == distances[lo]:
+            lo -= 1
+        while hi < n and distances[hi] == distances[hi - 1]:
+            hi += 1
+
+        keys = np.abs(distances[lo:hi] - radius)
+        indexes = order[lo:hi]
+
+        # partial selection of the k smallest keys, ties broken by index
+        if len(keys) > k:
+            kth = np.partition(keys, k - 1)[k - 1]
+            selected = keys <= kth
+            keys, indexes = keys[selected], indexes[selected]
+
+        return indexes[np.lexsort((indexes, keys))][:k].tolist()
 
-def find_index_at_distance(center: tuple, min_radius: float, max_radius: float, points: list):
-    # Find the index of the points that are at a distance between min_radius and max_radius from the center
-    indexes = []
-    for i in range(len(points)):
-        distance = math.dist(center, points[i])
-        if min_radius <= distance <= max_radius:
-            indexes.append(i)
-    return indexes
+    def at_distance(self, center: int, min_radius: float, max_radius: float) -> list:
+        # The indexes (in increasing order) of the stations at a distance between min_radius and max_radius from the station center
+        distances, order = self.row(center)
+        lo = np.searchsorted(distances, min_radius, side="left")
+        hi = np.searchsorted(distances, max_radius, side="right")
+        return np.sort(order[lo:hi]).tolist()
@@ -1,5 +1,5 @@
 import json
-from abc import ABC, abstractmethod
+from abc import ABC
 
 class ConfigFileNotFound(Exception):
     pass
@@ -7,23 +7,26 @@ class ConfigFileNotFound(Exception):
 class NegativeBatteryLevel(Exception):
     pass
 
+# Attributes of each vehicle, stored in the __slots__ of the vehicle classes (or in a Fleet, see simulation.fleet)
+STATE = ("id", "battery", "charge_start_time", "charge_rate")
+
 class Vehicle(ABC):
+    # The subclasses store the state of the vehicle: with __slots__ = STATE, or with properties
+    __slots__ = ()
+
+    # Maximum capacity and energy consumption of the vehicles of the class, set by load_config/configure
+    max_capacity = None
+    energy_consumption = None
+
     def __init__(self, vehicle_id):
         # Initialize the Vehicle with a unique ID and a default battery level of 1
         self.id = vehicle_id
         self.battery = 1
 
-    @property
-    @abstractmethod
-    def max_capacity(self):
-        # Abstract property representing the maximum capacity of the vehicle
-        pass
-
-    @property
-    @abstractmethod
-    def energy_consumption(self):
-        # Abstract property representing the energy consumption of the vehicle
-        pass
+        # Set while the vehicle is charged by an analytic station (see AnalyticStation)
+        # the battery attribute is updated only when the charge ends
+        self.charge_start_time = None
+        self.charge_rate = 0
 
     def move(self, distance: float):
         # Move the vehicle by a specified distance, update battery level
@@ -52,6 +55,12 @@ class Vehicle(ABC):
         # Fully charge the vehicle by setting the battery level to 1
         self.battery = 1
 
+    def battery_at(self, now: float):
+        # Battery level at time now, including the charge received since charge_start_time
+        if self.charge_start_time is None:
+            return self.battery
+        return min(1, self.battery + (now - self.charge_start_time) * self.charge_rate / self.max_capacity)
+
     def charge(self, percentage):
         # Charge the vehicle by a specified percentage, ensuring the battery level does not exceed 1
         self.battery += percentage
@@ -63,15 +72,24 @@ class Vehicle(ABC):
         # Load configuration data from a JSON file and update class attributes accordingly
         try:
             with open(config_file, 'r') as file:
-                config_data = json.load(file)[cls.__name__]
-                for key, value in config_data.items():
-                    setattr(cls, key, value)
+                cls.configure(json.load(file))
         except FileNotFoundError:
             # Raise a custom exception if the configuration file is not found
             raise ConfigFileNotFound(f'File {config_file} not found')
 
+    @classmethod
+    def configure(cls, vehicle_data: dict):
+        # Update class attributes with the configuration of the class in vehicle_data (the content of vehicle.json)
+        for key, value in vehicle_data[cls.__name__].items():
+            setattr(cls, key, value)
+
+        # plain class attributes, read on every move and charge
+        cls.max_capacity = cls.BATTERY_CAPACITY
+        cls.energy_consumption = cls.ENERGY_CONSUMPTION
+
 class Scooter(Vehicle):
     # Subclass of Vehicle representing a Scooter
+    __slots__ = STATE
 
     # Class-level attributes for configuring the Scooter's behavior
     BATTERY_CAPACITY = None
@@ -81,19 +99,10 @@ class Scooter(Vehicle):
         # Initialize Scooter using the base class constructor
         super().__init__(scooter_id)
 
-    @property
-    def max_capacity(self):
-        # Override the abstract property to provide Scooter-specific max capacity
-        return self.BATTERY_CAPACITY
-    
-    @property
-    def energy_consumption(self):
-        # Override the abstract property to provide Scooter-specific energy consumption
-        return self.ENERGY_CONSUMPTION
-
     
 class Bike(Vehicle):
     # Subclass of Vehicle representing a Bike
+    __slots__ = STATE
 
     # Class-level attributes for configuring the Bike's behavior
     BATTERY_CAPACITY = None
@@ -102,13 +111,3 @@ class Bike(Vehicle):
     def __init__(self, bike_id):
         # Initialize Bike using the base class constructor
         super().__init__(bike_id)
-
-    @property
-    def max_capacity(self):
-        # Override the abstract property to provide Bike-specific max capacity
-        return self.BATTERY_CAPACITY
-    
-    @property
-    def energy_consumption(self):
-        # Override the abstract property to provide Bike-specific energy consumption
-        return self.ENERGY_CONSUMPTION
\ No newline at end of file
@@ -0,0 +1,104 @@
+from environment.env import Environment
+from simulation.results import ResultCollector
+from simulation.termination import Termination
+from metrics import TripAccumulator
+
+from setup import setup_simulation, load_scheduler
+from cache import DemandCache, LayoutCache
+
+# Programmatic interface of the simulator
+#
+#     from simulator import Simulation
+#     result = Simulation(config, vehicle_config, seed).run()
+#     result["summary"]["avg_total_time"], result["trips"]["Distance"], result["statistics"]["unlock_time"]["median"]
+#
+# config and vehicle_config are the content of simulation.json and vehicle.json (they aren't modified).
+# Without dir_path nothing is read from or written to disk: the trip table, the statistics and the counters
+# of the stations are returned in memory, so a simulation can be run many times in the same process
+# (e.g. by an optimizer or a notebook). main.run_simulation uses the same class to write the result files.
+
+class Simulation:
+    def __init__(self, config: dict, vehicle_config: dict, seed: int, scheduler_type: str = None, dir_path: str = None, demand_cache: DemandCache = None, layout_cache: LayoutCache = None, verbose: bool = False):
+        # scheduler_type: event queue of the environment, None means the one in the configuration
+        # dir_path: directory of the result file (see ResultCollector), None to keep the trips only in memory
+        # demand_cache: cache of the generated users, None to always generate them
+        # layout_cache: station layouts shared by the simulations of the same process, None to always generate them
+        # verbose: print the progress of the simulation
+        self.config = config
+        self.vehicle_config = vehicle_config
+        self.seed = seed
+        self.scheduler_type = scheduler_type
+        self.dir_path = dir_path
+        self.demand_cache = demand_cache
+        self.layout_cache = layout_cache
+        self.verbose = verbose
+
+        # set by simulate
+        self.env = None
+        self.stations = None
+        self.results = None
+        self.accumulator = None
+        self.stop_reason = None
+
+    def simulate(self) -> str:
+        # Set up and run the simulation, returns the stop reason (see Termination.run)
+        # The trips are in self.results, the stations in self.stations
+        analysis = self.config.get("analysis", {})
+        params = self.config.get("results", {})
+
+        # statistiche calcolate durante la simulazione, senza la tabella dei viaggi (see metrics)
+        # also needed when the trips are neither kept in memory nor written
+        online = analysis.get("online", False) or (self.dir_path is None and not params.get("keep", True))
+        self.accumulator = TripAccumulator(analysis.get("bin_width", 0.01), analysis.get("sketch_k", 200)) if online else None
+
+        # raccolta dei risultati della simulazione
+        self.results = ResultCollector(self.dir_path, params, self.accumulator)
+
+        # inizializzazione ambiente
+        self.env = Environment(load_scheduler(self.config, self.scheduler_type))
+
+        if self.verbose:
+            print("Setting up simulation...", end="\n\t")
+        self.stations = setup_simulation(self.env, self.config, self.seed, self.results, self.vehicle_config, self.demand_cache, self.layout_cache, self.verbose)
+
+        if self.verbose:
+            print("Starting simulation...", end=" ")
+
+        # fino a run_time o a un criterio di terminazione (see simulation.termination)
+        termination = Termination(self.env, self.results, self.config.get("termination", {}))
+        self.stop_reason = termination.run(self.config.get("run_time"))
+
+        # scrittura dei risultati rimasti in memoria
+        self.results.close()
+
+        return self.stop_reason
+
+    def trips(self):
+        # Completed trips (structured array with the columns of simulation.results.COLUMNS), None if they aren't kept
+        if not self.results.keep and self.dir_path is None:
+            return None
+        return self.results.records()
+
+    def run(self) -> dict:
+        # Simulate and analyze the results in memory, returns
+        # {
+        #     "trips": completed trips (see trips),
+        #     "statistics": statistics of each metric (see metrics.trip_statistics),
+        #     "stations": counters of each station (columns of stations.csv),
+        #     "summary": main statistics (see analisys.analyze),
+        #     "report": text of statistics.txt
+        # }
+        from analisys import analyze, station_table
+
+        self.simulate()
+        trips = self.trips()
+        stations = station_table(self.stations)
+        analyzed = analyze(self.config, self.seed, trips, self.accumulator, stations, self.stop_reason, self.env.now())
+
+        return {
+            "trips": trips,
+            "statistics": analyzed["statistics"],
+            "stations": stations,
+            "summary": analyzed["summary"],
+            "report": analyzed["report"],
+        }
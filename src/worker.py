@@ -0,0 +1,157 @@
+from simulator import Simulation
+from simulation.utils import load_config
+from setup import simplified_configuration
+from cache import LayoutCache
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+import os, sys, json, time, signal, threading, socketserver
+
+# Resident simulation worker
+#
+# A long-lived process that runs the simulations requested on stdin (or on a local socket) and replies
+# with their statistics, one JSON object per line. Python, the imports, the vehicle configuration and the
+# station layouts (see cache.LayoutCache) stay warm between the requests, so a run costs only the simulation.
+#
+# Request:  {"id": ..., "config": {...}, "vehicle": {...}, "seed": N}
+#           config is the content of simulation.json (or "simplified": the content of simplified.json),
+#           vehicle the content of vehicle.json (default config/vehicle.json), id is returned as is
+# Response: {"id": ..., "summary": {...}, "statistics": {...}, "elapsed": seconds}
+#           or {"id": ..., "error": "...", "elapsed": seconds}
+#
+# With --workers=N the requests are run by a pool of N resident worker processes, the responses are written
+# as the simulations complete (not in order of request).
+#
+# Usage: python3 worker.py [--workers=N] [--socket=PATH]
+
+VEHICLE_CONFIG = None
+
+# station layouts of this process, shared by its simulations
+LAYOUT_CACHE = LayoutCache()
+
+def vehicle_config() -> dict:
+    # config/vehicle.json, read once
+    global VEHICLE_CONFIG
+    if VEHICLE_CONFIG is None:
+        VEHICLE_CONFIG = load_config(os.path.join(os.path.dirname(__file__), "../config/vehicle.json"))
+    return VEHICLE_CONFIG
+
+def to_json(statistics: dict) -> dict:
+    # NumPy values as Python floats, NaN as null
+    return {name: {key: None if np.isnan(value) else float(value) for key, value in values.items()} for name, values in statistics.items()}
+
+def handle(request: dict) -> dict:
+    # Run the simulation of a request, returns the response
+    start = time.perf_counter()
+    response = {"id": request.get("id")}
+    try:
+        vehicle = request.get("vehicle") or vehicle_config()
+        if "simplified" in request:
+            config, vehicle = simplified_configuration(request["simplified"], vehicle)
+        else:
+            config = request["config"]
+
+        result = Simulation(config, vehicle, request["seed"], layout_cache=LAYOUT_CACHE).run()
+        response["summary"] = result["summary"]
+        response["statistics"] = to_json(result["statistics"])
+    except Exception as e:
+        response["error"] = repr(e)
+    response["elapsed"] = time.perf_counter() - start
+    return response
+
+def parse(line: str) -> tuple:
+    # Request of a line and the error that prevents running it (None if it can be run)
+    try:
+        request = json.loads(line)
+    except json.decoder.JSONDecodeError as e:
+        return None, "Invalid request: {}".format(e)
+    if not isinstance(request, dict):
+        return None, "Invalid request: not a JSON object"
+    if "seed" not in request or ("config" not in request and "simplified" not in request):
+        return request, "Invalid request: seed and config (or simplified) are required"
+    return request, None
+
+def submit(executor, line: str):
+    # Future of the response of the request of a line (an invalid request is answered without running it,
+    # with its id if the line is a JSON object)
+    request, error = parse(line)
+    if error is not None:
+        response = {"id": None if request is None else request.get("id"), "error": error, "elapsed": 0.0}
+        future = executor.submit(dict, response)
+    else:
+        future = executor.submit(handle, request)
+    return future
+
+def serve_stream(executor, lines, output):
+    # Answer the requests of the lines on output, as the simulations complete
+    lock = threading.Lock()
+    pending = []
+
+    def reply(future):
+        with lock:
+            print(json.dumps(future.result()), file=output, flush=True)
+
+    for line in lines:
+        if not line.strip():
+            continue
+        future = submit(executor, line)
+        future.add_done_callback(reply)
+        pending.append(future)
+
+    for future in pending:
+        future.result()
+
+def serve_socket(executor, path: str):
+    # Answer the requests of each connection to the Unix socket path (connections are served concurrently,
+    # the requests of a connection in order)
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                line = line.decode()
+                if not line.strip():
+                    continue
+                response = submit(executor, line).result()
+                self.wfile.write((json.dumps(response) + "\n").encode())
+
+    if os.path.exists(path):
+        os.remove(path)
+
+    # stopped with SIGTERM (or Ctrl-C), the socket is removed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    with socketserver.ThreadingUnixStreamServer(path, Handler) as server:
+        print("Listening on {}".format(path), file=sys.stderr)
+        try:
+            server.serve_forever()
+        finally:
+            os.remove(path)
+
+def main():
+    workers = 1
+    socket_path = None
+
+    for arg in sys.argv[1:]:
+        if arg == "-h" or arg == "--help":
+            print("Usage: python3 {} [--workers=N] [--socket=PATH]".format(sys.argv[0]))
+            print("\t--workers=N\t\tNumber of resident worker processes (default 1: the simulations run in this process)")
+            print("\t--socket=PATH\t\tServe the requests on a Unix socket instead of stdin")
+            exit()
+
+        elif arg.startswith("--workers="):
+            workers = int(arg.split("=")[1])
+
+        elif arg.startswith("--socket="):
+            socket_path = arg.split("=")[1]
+
+    # a single worker runs the simulations one at a time in this process (they share the state of the classes),
+    # a pool runs them in resident processes with their own caches
+    executor = ThreadPoolExecutor(max_workers=1) if workers <= 1 else ProcessPoolExecutor(max_workers=workers)
+
+    with executor:
+        if socket_path is None:
+            serve_stream(executor, sys.stdin, sys.stdout)
+        else:
+            serve_socket(executor, socket_path)
+
+if __name__ == "__main__":
+    main()